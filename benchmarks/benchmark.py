@@ -0,0 +1,341 @@
+"""
+Benchmarks for inference, mutation, repopulation and serialization
+
+Usage:
+    python benchmarks/benchmark.py                        # run everything, print a table
+    python benchmarks/benchmark.py --output results.json  # also write the results as json
+    python benchmarks/benchmark.py --compare results.json # compare against a saved baseline
+
+Every benchmark is run repeatedly for at least ``--min-time`` seconds and the
+median latency of one operation is reported, together with the throughput
+(operations or samples per second) and the peak memory allocated by numpy
+and python during a single operation (measured separately with tracemalloc).
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from neural_network import NeuralNetwork, Genome, NeuroEvolution
+from neural_network.utils import seed
+
+DEFAULT_SIZES = ["4,8,2", "16,64,64,4", "64,256,256,16", "256,512,512,64"]
+DEFAULT_POPULATIONS = [20, 100]
+BATCH_SIZE = 256
+
+# Modules "import neural_network" must not load (they are only imported when needed)
+HEAVY_MODULES = ["tkinter", "tqdm", "multiprocessing"]
+
+IMPORT_SCRIPT = """
+import sys, time, tracemalloc
+if sys.argv[1] == "memory":
+    tracemalloc.start()
+start = time.perf_counter()
+import neural_network
+duration = time.perf_counter() - start
+print(duration, tracemalloc.get_traced_memory()[1])
+print(",".join(name for name in sys.argv[2:] if name in sys.modules))
+"""
+
+
+class BenchGenome(Genome):
+    "Synthetic genome with a deterministic fitness: the mean output for fixed inputs"
+
+    def setup(self, samples: int = 16):
+        inputs = np.random.default_rng(0).random((samples, self.network.sizes[0]))
+        self.obj = BenchObject(inputs)
+
+    def run_evaluation(self, generation: int = None):
+        self.obj.score = float(self.network.feed_forward_batch(self.obj.inputs).mean())
+
+
+class BenchObject():
+    "State of a BenchGenome"
+
+    def __init__(self, inputs):
+        self.inputs = inputs
+        self.score = 0
+
+
+class BenchEvolution(NeuroEvolution):
+    "NeuroEvolution with a fixed network layout"
+
+    def __init__(self, sizes: list, *args, **kwargs):
+        self.sizes = sizes
+        super().__init__(BenchGenome, *args, **kwargs)
+
+    def _get_default_network(self) -> NeuralNetwork:
+        return NeuralNetwork(list(self.sizes))
+
+
+@contextlib.contextmanager
+def quiet():
+    "Hide the progress output of the library"
+
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        yield
+
+
+def measure(func, min_time: float, items: int = 1, setup=None) -> dict:
+    "Run ``func`` repeatedly and return its median latency, throughput and peak memory"
+
+    timings = []
+    total = 0.0
+    while total < min_time or len(timings) < 3:
+        arg = setup() if setup else None
+        start = time.perf_counter()
+        func(arg)
+        duration = time.perf_counter() - start
+        timings.append(duration)
+        total += duration
+
+    arg = setup() if setup else None
+    tracemalloc.start()
+    func(arg)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latency = statistics.median(timings)
+    return {
+        "latency_s": latency,
+        "throughput": items / latency if latency else float("inf"),
+        "peak_bytes": peak,
+        "runs": len(timings),
+    }
+
+
+def bench_import(min_time: float) -> "tuple[dict, list]":
+    "Time 'import neural_network' in fresh interpreters - also returns the heavy modules it loaded"
+
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [sys.path[0], os.environ.get("PYTHONPATH")]))}
+
+    def run_import(mode: str) -> "tuple[float, int, list]":
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_SCRIPT, mode, *HEAVY_MODULES],
+            env=env, check=True, capture_output=True, text=True,
+        ).stdout.splitlines()
+        duration, peak = output[0].split()
+        return float(duration), int(peak), list(filter(None, output[1].split(",")))
+
+    timings = []
+    while sum(timings) < min_time or len(timings) < 5:
+        timings.append(run_import("time")[0])
+
+    # Separate run, as tracemalloc slows down the import a lot
+    _, peak, loaded = run_import("memory")
+
+    latency = statistics.median(timings)
+    return {
+        "latency_s": latency,
+        "throughput": 1 / latency,
+        "peak_bytes": peak,
+        "runs": len(timings),
+    }, loaded
+
+
+def check_equivalence(network: NeuralNetwork, compiled, inputs: np.ndarray) -> None:
+    "Make sure the compiled network (float32) gives the same results as the reference implementation"
+
+    expected = network.feed_forward_batch(inputs)
+    actual = compiled.feed_forward_batch(inputs)
+    error = np.abs(actual - expected).max()
+    if error > 1e-4 * max(1.0, np.abs(expected).max()):
+        raise AssertionError(f"Compiled network differs from the reference by {error} (sizes: {network.sizes})")
+
+
+def bench_network(sizes: list, min_time: float) -> list:
+    "Benchmarks of a single network"
+
+    network = NeuralNetwork(list(sizes))
+    single = np.random.default_rng(0).random(sizes[0]).tolist()
+    batch = np.random.default_rng(0).random((BATCH_SIZE, sizes[0]))
+    jsondata = network.to_json()
+
+    compiled = network.compile()
+    check_equivalence(network, compiled, batch)
+
+    return [
+        ("feed_forward", measure(lambda _: network.feed_forward(single), min_time)),
+        ("feed_forward_batch", measure(lambda _: network.feed_forward_batch(batch), min_time, BATCH_SIZE)),
+        ("compiled_feed_forward", measure(lambda _: compiled.feed_forward(single), min_time)),
+        ("compiled_feed_forward_batch", measure(lambda _: compiled.feed_forward_batch(batch), min_time, BATCH_SIZE)),
+        ("mutate", measure(lambda n: n.mutate(0.01, 0.05), min_time, setup=network.clone)),
+        ("clone", measure(lambda _: network.clone(), min_time)),
+        ("clone_and_mutate", measure(lambda _: network.clone_and_mutate(0.01, 0.05), min_time)),
+        ("to_json", measure(lambda _: network.to_json(), min_time)),
+        ("from_json", measure(lambda _: NeuralNetwork.from_json(jsondata), min_time)),
+    ]
+
+
+def bench_population(sizes: list, population: int, min_time: float, max_json_params: int) -> list:
+    "Benchmarks of a whole NeuroEvolution population"
+
+    folder = tempfile.mkdtemp() + os.sep
+    try:
+        with quiet():
+            trainer = BenchEvolution(sizes, name="bench", folder=folder)
+            trainer.population_size = population
+            trainer.setup_from_scratch()
+            trainer.run_generation()
+
+        def run_generation(_):
+            with quiet():
+                trainer.run_generation()
+
+        results = [
+            ("generate_genomes", measure(lambda _: trainer._generate_genomes(0.01), min_time, population)),
+            ("run_generation", measure(run_generation, min_time, population)),
+        ]
+
+        formats = ["binary"]
+        if NeuralNetwork.count_params(sizes) * population <= max_json_params:
+            formats.insert(0, "json")
+
+        for saveformat in formats:
+            trainer.save_format = saveformat
+
+            def save(_):
+                with quiet():
+                    trainer.save_to_file()
+
+            def load(_):
+                with quiet():
+                    loaded = BenchEvolution(sizes, name="bench", folder=folder)
+                    loaded.population_size = population
+                    loaded.setup_from_file()
+
+            results.append((f"save_{saveformat}", measure(save, min_time)))
+            results.append((f"load_{saveformat}", measure(load, min_time)))
+            for filename in os.listdir(folder):
+                os.remove(folder + filename)
+
+        return results
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def run(args) -> list:
+    "Run all selected benchmarks"
+
+    results = []
+
+    def add(name, sizes, population, result):
+        if args.ops and name not in args.ops:
+            return
+        entry = {"name": name, "sizes": sizes, "population": population, **result}
+        results.append(entry)
+        print(format_result(entry))
+
+    if not args.ops or "import" in args.ops:
+        result, loaded = bench_import(args.min_time)
+        add("import", [], None, result)
+        if loaded:
+            print(f"ERROR: 'import neural_network' loaded {', '.join(loaded)} - these should be imported lazily!")
+            args.import_failed = True
+
+    for sizestring in args.sizes:
+        sizes = [int(size) for size in sizestring.split(",")]
+        seed(0)
+
+        for name, result in bench_network(sizes, args.min_time):
+            add(name, sizes, None, result)
+
+        for population in args.populations:
+            for name, result in bench_population(sizes, population, args.min_time, args.max_json_params):
+                add(name, sizes, population, result)
+
+    return results
+
+
+def format_result(entry: dict) -> str:
+    "Format a result as one line of the table"
+
+    sizes = ",".join(map(str, entry["sizes"]))
+    population = entry["population"] or "-"
+    return (f"{entry['name']:<28} {sizes:<18} {population!s:>5} "
+            f"{entry['latency_s']*1000:>12.4f} ms {entry['throughput']:>14.1f} /s "
+            f"{entry['peak_bytes']/1024:>12.1f} KiB")
+
+
+def result_key(entry: dict) -> tuple:
+    return (entry["name"], tuple(entry["sizes"]), entry["population"])
+
+
+def compare(results: list, baseline: dict, threshold: float) -> bool:
+    "Print the latency change against a baseline - returns False if anything regressed"
+
+    old = {result_key(entry): entry for entry in baseline["results"]}
+    ok = True
+
+    print("\nComparison against baseline (latency, new / old):")
+    for entry in results:
+        previous = old.get(result_key(entry))
+        if previous is None:
+            continue
+        ratio = entry["latency_s"] / previous["latency_s"]
+        regressed = ratio > 1 + threshold
+        ok = ok and not regressed
+        marker = "REGRESSION" if regressed else ("faster" if ratio < 1 - threshold else "")
+        print(f"{format_result(entry)}   x{ratio:.2f} {marker}")
+
+    return ok
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", default=DEFAULT_SIZES, help="network sizes, e.g. 4,8,2")
+    parser.add_argument("--populations", nargs="+", type=int, default=DEFAULT_POPULATIONS)
+    parser.add_argument("--ops", nargs="+", help="only run these benchmarks (e.g. import feed_forward mutate)")
+    parser.add_argument("--min-time", type=float, default=0.2, help="minimum seconds per benchmark")
+    parser.add_argument("--max-json-params", type=int, default=5_000_000,
+                        help="skip json save/load if population x params is bigger than this")
+    parser.add_argument("--output", help="write the results to this json file")
+    parser.add_argument("--compare", help="compare against the results in this json file")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="relative latency increase counted as a regression (default: 0.2)")
+    args = parser.parse_args(argv)
+    args.import_failed = False
+
+    print(f"{'benchmark':<28} {'sizes':<18} {'pop':>5} {'latency':>15} {'throughput':>17} {'peak memory':>16}")
+    results = run(args)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump({
+                "meta": {
+                    "python": platform.python_version(),
+                    "numpy": np.__version__,
+                    "machine": platform.machine(),
+                    "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                },
+                "results": results,
+            }, file, indent=4)
+
+    if args.import_failed:
+        return 1
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as file:
+            baseline = json.load(file)
+        if not compare(results, baseline, args.threshold):
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,36 @@
+import importlib
+
 from .activation_functions import ACFUNCS
 from .network import NeuralNetwork
 from .genome import Genome
 from .loader import NeuroLoader
-from .training import NeuroEvolution
-from .gui import TrainingGUI
+
+# Loaded on first access (see __getattr__), so processes only using NeuroLoader
+# and NeuralNetwork don't have to import tkinter, tqdm, multiprocessing etc.
+_LAZY_IMPORTS = {
+    "PopulationEngine": ".population",
+    "ProcessPoolEvaluator": ".parallel",
+    "SharedMemoryEvaluator": ".parallel",
+    "DistributedEvaluator": ".distributed",
+    "CheckpointWriter": ".checkpoint",
+    "FitnessCache": ".fitnesscache",
+    "GenerationMetrics": ".metrics",
+    "NeuroEvolution": ".training",
+    "GenerationInterrupted": ".training",
+    "SupervisedTrainer": ".supervised",
+    "TrainingGUI": ".gui",
+}
+
+__all__ = ["ACFUNCS", "NeuralNetwork", "Genome", "NeuroLoader", *_LAZY_IMPORTS]
+
+
+def __getattr__(name):
+    if name in _LAZY_IMPORTS:
+        value = getattr(importlib.import_module(_LAZY_IMPORTS[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_IMPORTS))
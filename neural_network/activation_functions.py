@@ -2,6 +2,8 @@
 
 import math
 
+import numpy as np
+
 def identity(t):
     "Identity function"
     return t
@@ -19,8 +21,11 @@ def leaky_relu(t):
     return 0.01*t if t < 0 else t
 
 def sigmoid(t):
-    "Sigmoid function"
-    return 1/(1+math.exp(-t))
+    "Sigmoid function (numerically stable: never overflows)"
+    if t >= 0:
+        return 1/(1+math.exp(-t))
+    e = math.exp(t)
+    return e/(1+e)
 
 ACFUNCS = {
     "identity": identity,
@@ -29,3 +34,120 @@ ACFUNCS = {
     "leaky_relu": leaky_relu,
     "sigmoid": sigmoid,
 }
+
+# Vectorized versions - these work on whole numpy arrays at once
+
+def identity_array(t: np.ndarray) -> np.ndarray:
+    "Identity function (vectorized)"
+    return t
+
+def binary_step_array(t: np.ndarray) -> np.ndarray:
+    "Binary step function (vectorized)"
+    return (t >= 0).astype(t.dtype)
+
+def relu_array(t: np.ndarray) -> np.ndarray:
+    "Rectified linear unit (vectorized)"
+    return np.maximum(t, 0)
+
+def leaky_relu_array(t: np.ndarray) -> np.ndarray:
+    "Leaky rectified linear unit (vectorized)"
+    return np.where(t < 0, 0.01*t, t)
+
+def sigmoid_array(t: np.ndarray) -> np.ndarray:
+    "Sigmoid function (vectorized, numerically stable: never overflows)"
+    e = np.exp(-np.abs(t))
+    return np.where(t >= 0, 1/(1+e), e/(1+e))
+
+ACFUNCS_ARRAY = {
+    "identity": identity_array,
+    "binary_step": binary_step_array,
+    "relu": relu_array,
+    "leaky_relu": leaky_relu_array,
+    "sigmoid": sigmoid_array,
+}
+
+# Derivatives (vectorized, of the input t) - used for backpropagation
+
+def identity_derivative_array(t: np.ndarray) -> np.ndarray:
+    "Derivative of the identity function"
+    return np.ones_like(t)
+
+def binary_step_derivative_array(t: np.ndarray) -> np.ndarray:
+    "Derivative of the binary step function (0 everywhere: no gradient flows through it)"
+    return np.zeros_like(t)
+
+def relu_derivative_array(t: np.ndarray) -> np.ndarray:
+    "Derivative of the rectified linear unit"
+    return (t > 0).astype(t.dtype)
+
+def leaky_relu_derivative_array(t: np.ndarray) -> np.ndarray:
+    "Derivative of the leaky rectified linear unit"
+    return np.where(t < 0, 0.01, 1).astype(t.dtype)
+
+def sigmoid_derivative_array(t: np.ndarray) -> np.ndarray:
+    "Derivative of the sigmoid function"
+    s = sigmoid_array(t)
+    return s*(1-s)
+
+ACFUNCS_DERIVATIVE = {
+    "identity": identity_derivative_array,
+    "binary_step": binary_step_derivative_array,
+    "relu": relu_derivative_array,
+    "leaky_relu": leaky_relu_derivative_array,
+    "sigmoid": sigmoid_derivative_array,
+}
+
+
+def get_array_acfunc(acfunc) -> "function":
+    """
+    Get the vectorized version of an activation function
+
+    ``acfunc`` is either the name of a function in ACFUNCS or a custom
+    function working on single numbers (which is vectorized, but slow).
+    """
+
+    if isinstance(acfunc, str):
+        if not acfunc in ACFUNCS_ARRAY:
+            raise ValueError(f"Invalid activation function name: {acfunc}")
+        return ACFUNCS_ARRAY[acfunc]
+    return np.vectorize(acfunc, otypes=[np.float64])
+
+def get_array_acfunc_derivative(acfunc) -> "function":
+    """
+    Get the vectorized derivative of an activation function
+
+    ``acfunc`` is either the name of a function in ACFUNCS or a custom
+    function working on single numbers (whose derivative is approximated
+    numerically, which is slow).
+    """
+
+    if isinstance(acfunc, str):
+        if not acfunc in ACFUNCS_DERIVATIVE:
+            raise ValueError(f"Invalid activation function name: {acfunc}")
+        return ACFUNCS_DERIVATIVE[acfunc]
+
+    h = 1e-6
+    return np.vectorize(lambda t: (acfunc(t+h) - acfunc(t-h)) / (2*h), otypes=[np.float64])
+
+def get_mixed_array_acfunc(acfuncs: list, getter=get_array_acfunc) -> "function":
+    """
+    Get a vectorized function applying a different activation function to
+    each column (neuron) of its input - slower than a single function per layer
+
+    ``getter`` looks up the vectorized function of each activation function
+    (e.g. get_array_acfunc_derivative for the derivatives).
+    """
+
+    # Apply each distinct function once, to all columns using it
+    columns = {}
+    for index, acfunc in enumerate(acfuncs):
+        columns.setdefault(acfunc, []).append(index)
+    groups = [(getter(acfunc), np.array(indexes)) for acfunc, indexes in columns.items()]
+
+    def mixed(t: np.ndarray) -> np.ndarray:
+        result = np.empty_like(t)
+        for acfunc, indexes in groups:
+            result[..., indexes] = acfunc(t[..., indexes])
+        return result
+
+    return mixed
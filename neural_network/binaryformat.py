@@ -0,0 +1,71 @@
+"""
+Binary file format for networks and populations
+
+Layout:
+    8 bytes   magic (b"NNBIN" + version)
+    8 bytes   length of the header (unsigned little endian)
+    n bytes   header (utf-8 json)
+    padding   up to the next multiple of ALIGNMENT bytes
+    rest      parameters of all networks as one contiguous (count x params) block
+
+The parameters of a network are stored layer by layer, weights (row by row)
+followed by biases - the same order as NeuralNetwork.get_params().
+Because the block is aligned and contiguous, it can be memory-mapped
+instead of being parsed.
+"""
+
+import json
+import struct
+
+import numpy as np
+
+MAGIC = b"NNBIN\x00\x01\x00"
+ALIGNMENT = 64
+
+
+def write_binary(file, header: dict, params: np.ndarray) -> None:
+    "Write a header and a 2-D (count x params) parameter block to an open binary file"
+
+    params = np.ascontiguousarray(params)
+    header = {
+        **header,
+        "dtype": params.dtype.str,
+        "shape": list(params.shape),
+    }
+    headerbytes = json.dumps(header).encode("utf-8")
+
+    file.write(MAGIC)
+    file.write(struct.pack("<Q", len(headerbytes)))
+    file.write(headerbytes)
+
+    position = len(MAGIC) + 8 + len(headerbytes)
+    file.write(b"\x00" * (-position % ALIGNMENT))
+    file.write(params.tobytes())
+
+
+def read_binary(filename: str, mmap_mode: str = "r") -> "tuple[dict, np.ndarray]":
+    """
+    Read the header and the parameter block of a binary file
+
+    ``mmap_mode`` is passed to numpy.memmap ("r": read only, "c": copy on
+    write). If it is None, the parameters are read into memory instead.
+    """
+
+    with open(filename, "rb") as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"'{filename}' is not a binary network file!")
+        headerlength, = struct.unpack("<Q", file.read(8))
+        header = json.loads(file.read(headerlength).decode("utf-8"))
+
+        position = len(MAGIC) + 8 + headerlength
+        offset = position + (-position % ALIGNMENT)
+        dtype = np.dtype(header["dtype"])
+        shape = tuple(header["shape"])
+
+        if mmap_mode is None:
+            file.seek(offset)
+            params = np.fromfile(file, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+            return header, params
+
+    params = np.memmap(filename, dtype=dtype, mode=mmap_mode, offset=offset, shape=shape)
+    return header, params
@@ -0,0 +1,85 @@
+"Asynchronous checkpointing"
+
+import atexit
+import collections
+import threading
+import traceback
+import typing
+
+
+class CheckpointWriter():
+    """
+    Writes checkpoints on a background thread
+
+    Jobs are functions writing an already taken snapshot to disk. At most
+    ``max_pending`` jobs wait while another one is being written - if more
+    are submitted, the oldest pending ones are dropped (coalesced), so a
+    slow disk can never slow down training. After each write, only the
+    saves of the ``keep_last`` latest generations are kept (if set).
+    """
+
+    def __init__(self, manager, keep_last: int = None, max_pending: int = 1):
+        if keep_last is not None and keep_last < 1:
+            raise ValueError("keep_last must be at least 1!")
+
+        self.manager = manager
+        self.keep_last = keep_last
+        self.dropped = 0
+
+        self._pending = collections.deque(maxlen=max_pending)
+        self._condition = threading.Condition()
+        self._busy = False
+        self._closed = False
+
+        self._thread = threading.Thread(target=self._run, name="CheckpointWriter", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, job: typing.Callable[[], None]) -> None:
+        "Queue a job (a function without arguments) to be run on the background thread"
+
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("CheckpointWriter is closed!")
+            if len(self._pending) == self._pending.maxlen:
+                self.dropped += 1
+            self._pending.append(job)
+            self._condition.notify_all()
+
+    def flush(self) -> None:
+        "Wait until all queued jobs are written"
+
+        with self._condition:
+            self._condition.wait_for(lambda: not self._pending and not self._busy)
+
+    def close(self) -> None:
+        "Write all queued jobs and stop the background thread"
+
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+        atexit.unregister(self.close)
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending or self._closed)
+                if not self._pending:
+                    return
+                job = self._pending.popleft()
+                self._busy = True
+
+            try:
+                job()
+                if self.keep_last:
+                    self.manager._remove_old_files(self.keep_last)
+            except Exception: # pylint: disable=broad-except
+                # Keep the writer alive - the next checkpoint might succeed
+                traceback.print_exc()
+            finally:
+                with self._condition:
+                    self._busy = False
+                    self._condition.notify_all()
@@ -0,0 +1,246 @@
+"""
+Command line interface for headless training
+
+Example:
+    python -m neural_network train mygame.genomes:PlayerGenome --sizes 8,16,4 \\
+        --folder data/ --set population_size=200 --generations 500 --checkpoint-every 10
+"""
+
+import argparse
+import importlib
+import json
+import os
+import signal
+import sys
+import time
+
+from .network import NeuralNetwork, DTYPES
+from .training import NeuroEvolution, GenerationInterrupted
+from .distributed import parse_address, run_worker
+
+
+def import_object(path: str):
+    "Import an object by its path ('package.module:Name' or 'package.module.Name')"
+
+    if ":" in path:
+        modulename, _, attribute = path.partition(":")
+    else:
+        modulename, _, attribute = path.rpartition(".")
+    if not modulename or not attribute:
+        raise ValueError(f"Invalid import path: '{path}' (expected 'module:Name')")
+
+    # Make modules in the working directory importable (as with "python -m")
+    if os.getcwd() not in sys.path:
+        sys.path.insert(0, os.getcwd())
+
+    obj = importlib.import_module(modulename)
+    for name in attribute.split("."):
+        obj = getattr(obj, name)
+    return obj
+
+
+class SizesNeuroEvolution(NeuroEvolution):
+    "NeuroEvolution creating default networks from a list of sizes given on the command line"
+
+    def __init__(self, genome_class, *genome_setup_args, sizes: list = None, acfunc: str = "relu",
+                 name="neuro", folder="../data/", **genome_setup_kwargs):
+        self.sizes = sizes
+        self.acfunc = acfunc
+        super().__init__(genome_class, *genome_setup_args, name=name, folder=folder, **genome_setup_kwargs)
+
+    def _get_default_network(self) -> NeuralNetwork:
+        if not self.sizes:
+            raise NotImplementedError("Use --sizes or a --trainer class implementing _get_default_network()!")
+        return NeuralNetwork(list(self.sizes), default_acfunc=self.acfunc)
+
+
+def apply_fields(trainer: NeuroEvolution, fields: dict) -> None:
+    "Set editable fields on the trainer, converting the values to the type of the defaults"
+
+    for name, value in fields.items():
+        if name not in trainer.EDITABLE_FIELDS:
+            raise ValueError(f"'{name}' is not editable! Editable fields: {', '.join(trainer.EDITABLE_FIELDS)}")
+        tp = type(getattr(trainer, name))
+        setattr(trainer, name, tp(value))
+
+
+def parse_fields(assignments: list) -> dict:
+    "Parse 'name=value' assignments"
+
+    fields = {}
+    for assignment in assignments:
+        name, separator, value = assignment.partition("=")
+        if not separator:
+            raise ValueError(f"Invalid assignment: '{assignment}' (expected name=value)")
+        fields[name.strip()] = value.strip()
+    return fields
+
+
+def create_trainer(args) -> NeuroEvolution:
+    "Create the trainer from the command line arguments and the config file"
+
+    config = {}
+    if args.config:
+        with open(args.config, "r", encoding="utf-8") as file:
+            config = json.load(file)
+
+    genome_class = import_object(args.genome)
+    genome_args = json.loads(args.genome_args) if args.genome_args else config.pop("genome_args", [])
+    genome_kwargs = json.loads(args.genome_kwargs) if args.genome_kwargs else config.pop("genome_kwargs", {})
+
+    if args.trainer:
+        trainer_class = import_object(args.trainer)
+        trainer = trainer_class(genome_class, *genome_args, name=args.name, folder=args.folder, **genome_kwargs)
+    else:
+        sizes = [int(size) for size in args.sizes.split(",")] if args.sizes else None
+        trainer = SizesNeuroEvolution(genome_class, *genome_args, sizes=sizes, acfunc=args.acfunc,
+                                      name=args.name, folder=args.folder, **genome_kwargs)
+
+    # Command line assignments override the config file
+    apply_fields(trainer, {**config, **parse_fields(args.set)})
+
+    if args.checkpoint_every is not None:
+        trainer.checkpoint_interval = args.checkpoint_every
+    trainer.save_format = args.save_format
+    if args.dtype:
+        trainer.dtype = args.dtype
+    trainer.metrics_log = args.metrics_log
+    trainer.reuse_genomes = args.reuse_genomes
+
+    return trainer
+
+
+def train(args) -> int:
+    "Run the training until one of the limits is reached"
+
+    trainer = create_trainer(args)
+
+    if args.fresh:
+        trainer.setup_from_scratch()
+    else:
+        trainer.setup_auto()
+
+    if args.listen:
+        host, port = parse_address(args.listen, default_host="0.0.0.0")
+        trainer.use_distributed(host, port, token=args.token)
+    elif args.workers and args.shared_memory:
+        trainer.use_shared_memory(args.workers, args.chunksize)
+    elif args.workers:
+        trainer.use_process_pool(args.workers, args.chunksize)
+    if args.keep_last:
+        trainer.enable_async_checkpoints(keep_last=args.keep_last)
+
+    # Ctrl+C: stop after the current genome, restore the last finished generation and save it
+    stop = []
+    def interrupt(*_):
+        stop.append(True)
+        trainer.request_interrupt()
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+    signal.signal(signal.SIGINT, interrupt)
+
+    start = time.monotonic()
+    generations = 0
+    highscore = None
+    reason = "generation limit reached"
+
+    try:
+        while args.generations is None or generations < args.generations:
+            if args.time_budget is not None and time.monotonic() - start >= args.time_budget:
+                reason = "time budget used up"
+                break
+
+            try:
+                highscore = trainer.run_generation()
+            except GenerationInterrupted:
+                reason = "interrupted"
+                break
+            generations += 1
+
+            if stop:
+                reason = "interrupted"
+                break
+            if args.target_score is not None and highscore >= args.target_score:
+                reason = "target score reached"
+                break
+    finally:
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+
+        if generations:
+            # Save the final state, unless it has just been saved by the checkpoint interval
+            interval = trainer.checkpoint_interval
+            if not interval or trainer.generation % interval != 0:
+                trainer.save_to_file()
+            if args.export:
+                trainer.export_network_to_file(binary=args.save_format == "binary", prune_threshold=args.export_prune)
+
+        trainer.disable_async_checkpoints()
+        trainer.close_evaluator()
+
+    print(f"Stopped after {generations} generation(s) in {time.monotonic() - start:.1f}s ({reason}). "
+          f"Generation: {trainer.generation}, highscore: {highscore}")
+    return 0
+
+
+def worker(args) -> int:
+    "Evaluate genomes for a coordinator until it stops the worker"
+
+    host, port = parse_address(args.address)
+    try:
+        run_worker(host, port, token=args.token, connect_timeout=args.connect_timeout)
+    except OSError as e:
+        print(f"Could not connect to {host}:{port}: {e}")
+        return 1
+    return 0
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="neural_network", description="Headless neural network training")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_train = subparsers.add_parser("train", help="train a population with NeuroEvolution",
+                                         description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser_train.add_argument("genome", help="genome class, e.g. 'mypackage.module:MyGenome'")
+    parser_train.add_argument("--trainer", help="NeuroEvolution subclass to use (default: networks from --sizes)")
+    parser_train.add_argument("--sizes", help="layer sizes of new networks, e.g. 4,8,2")
+    parser_train.add_argument("--acfunc", default="relu", help="activation function of new networks")
+    parser_train.add_argument("--genome-args", help="json list of positional arguments for Genome.setup")
+    parser_train.add_argument("--genome-kwargs", help="json object of keyword arguments for Genome.setup")
+    parser_train.add_argument("--name", default="neuro")
+    parser_train.add_argument("--folder", default="../data/")
+    parser_train.add_argument("--config", help="json file with editable fields (and genome_args/genome_kwargs)")
+    parser_train.add_argument("--set", action="append", default=[], metavar="FIELD=VALUE",
+                              help="set an editable field (repeatable)")
+    parser_train.add_argument("--fresh", action="store_true", help="start from scratch instead of resuming")
+    parser_train.add_argument("--generations", type=int, help="number of generations to run (default: unlimited)")
+    parser_train.add_argument("--target-score", type=float, help="stop once the highscore reaches this")
+    parser_train.add_argument("--time-budget", type=float, help="seconds after which no new generation is started")
+    parser_train.add_argument("--checkpoint-every", type=int, help="save every N generations")
+    parser_train.add_argument("--keep-last", type=int, help="save on a background thread, keeping the last N saves")
+    parser_train.add_argument("--save-format", choices=["json", "binary"], default="json")
+    parser_train.add_argument("--dtype", choices=DTYPES, help="type of the network parameters (default: the type of the resumed population, or float64)")
+    parser_train.add_argument("--export", action="store_true", help="export the best network when stopping")
+    parser_train.add_argument("--export-prune", type=float, default=0.0, metavar="THRESHOLD",
+                              help="prune weights with a magnitude of at most this in the export")
+    parser_train.add_argument("--workers", type=int, help="evaluate genomes in N processes")
+    parser_train.add_argument("--chunksize", type=int, default=1, help="genomes per task sent to a worker")
+    parser_train.add_argument("--shared-memory", action="store_true", help="share the network parameters with the workers instead of sending them")
+    parser_train.add_argument("--metrics-log", action="store_true", help="write metrics to a json-lines file")
+    parser_train.add_argument("--reuse-genomes", action="store_true", help="reset genomes of old generations instead of setting up new ones")
+    parser_train.add_argument("--listen", metavar="HOST:PORT",
+                              help="evaluate genomes on workers connecting to this address (see the worker command)")
+    parser_train.add_argument("--token", help="secret the workers have to send to be accepted")
+    parser_train.set_defaults(func=train)
+
+    parser_worker = subparsers.add_parser("worker", help="evaluate genomes for a training started with --listen")
+    parser_worker.add_argument("address", help="address of the coordinator, e.g. 192.168.1.2:4921")
+    parser_worker.add_argument("--token", help="secret required by the coordinator")
+    parser_worker.add_argument("--connect-timeout", type=float, default=60.0,
+                               help="seconds to keep trying to (re)connect to the coordinator")
+    parser_worker.set_defaults(func=worker)
+
+    return parser
+
+
+def main(argv: list = None) -> int:
+    args = get_parser().parse_args(argv)
+    return args.func(args)
@@ -0,0 +1,120 @@
+"Compiled networks for fast inference"
+
+import numpy as np
+
+# Activation functions applied in place (to the scratch buffers)
+def _relu_inplace(t: np.ndarray) -> None:
+    np.maximum(t, 0, out=t)
+
+def _leaky_relu_inplace(t: np.ndarray) -> None:
+    np.multiply(t, 0.01, out=t, where=t < 0)
+
+def _binary_step_inplace(t: np.ndarray) -> None:
+    np.greater_equal(t, 0, out=t)
+
+INPLACE_ACFUNCS = {
+    "identity": lambda t: None,
+    "relu": _relu_inplace,
+    "leaky_relu": _leaky_relu_inplace,
+    "binary_step": _binary_step_inplace,
+}
+
+# Number of different batch sizes for which scratch buffers are kept
+MAX_BUFFERED_BATCH_SIZES = 8
+
+
+class CompiledNetwork():
+    """
+    Immutable inference plan of a NeuralNetwork (see NeuralNetwork.compile)
+
+    The parameters are copied into contiguous arrays of ``dtype`` (default:
+    float32), the activation functions are resolved once and the
+    intermediate results are written to scratch buffers which are reused
+    across calls (one set per batch size). If ``fuse`` is True, layers with
+    the identity activation function are merged into the following layer:
+    W2 (W1 x + b1) + b2 = (W2 W1) x + (W2 b1 + b2).
+
+    Later changes to the original network do not affect the compiled one.
+    Because of the shared buffers, a compiled network must not be used by
+    multiple threads at the same time.
+    """
+
+    def __init__(self, network, dtype=np.float32, fuse: bool = True):
+        self.dtype = np.dtype(dtype)
+        self.sizes = [network.sizes[0]]
+        network._update_kernels() # pylint: disable=protected-access
+
+        # (weights, biases, name, kernel) per layer - computed in float64, stored in dtype
+        layers = []
+        for index in range(1, len(network.sizes)):
+            weights = np.asarray(network.weights[index-1], dtype=np.float64)
+            biases = np.asarray(network.biases[index-1], dtype=np.float64)
+
+            if fuse and layers and layers[-1][2] == "identity":
+                lastweights, lastbiases, _, _ = layers.pop()
+                biases = weights @ lastbiases + biases
+                weights = weights @ lastweights
+
+            layers.append((weights, biases, network._kernelnames[index-1], network._kernels[index-1]))
+
+        self._layers = []
+        for weights, biases, name, kernel in layers:
+            # Transposed, so a batch (one row per sample) can be multiplied directly -
+            # always copied, so later changes to the network don't leak in
+            weights = np.array(weights.T, dtype=self.dtype, order="C")
+            biases = np.array(biases, dtype=self.dtype)
+            weights.flags.writeable = False
+            biases.flags.writeable = False
+
+            if name in INPLACE_ACFUNCS:
+                inplace = INPLACE_ACFUNCS[name]
+            else:
+                inplace = self._make_inplace(kernel)
+
+            self._layers.append((weights, biases, inplace))
+            self.sizes.append(weights.shape[1])
+
+        self._buffers = {}
+
+    @staticmethod
+    def _make_inplace(kernel: "function") -> "function":
+        "Wrap a vectorized activation function so that it writes its result into its input"
+
+        def inplace(t: np.ndarray) -> None:
+            t[...] = kernel(t)
+        return inplace
+
+    def __call__(self, inputs: list) -> list:
+        return self.feed_forward(inputs)
+
+    def _get_buffers(self, count: int) -> list:
+        "Get the scratch buffers for a batch of ``count`` samples"
+
+        buffers = self._buffers.get(count)
+        if buffers is None:
+            if len(self._buffers) >= MAX_BUFFERED_BATCH_SIZES:
+                self._buffers.clear()
+            buffers = [np.empty((count, size), dtype=self.dtype) for size in self.sizes[1:]]
+            self._buffers[count] = buffers
+        return buffers
+
+    def feed_forward_batch(self, inputs) -> np.ndarray:
+        "Process many inputs (one row per sample) - returns a new array with one row of outputs per sample"
+
+        inputs = np.asarray(inputs, dtype=self.dtype)
+        if inputs.ndim != 2 or inputs.shape[1] != self.sizes[0]:
+            raise ValueError(f"Inputs must be a 2-D matrix with {self.sizes[0]} columns.")
+
+        values = inputs
+        for (weights, biases, inplace), buffer in zip(self._layers, self._get_buffers(inputs.shape[0])):
+            np.matmul(values, weights, out=buffer)
+            buffer += biases
+            inplace(buffer)
+            values = buffer
+
+        return values.copy()
+
+    def feed_forward(self, inputs: list) -> list:
+        "Process the inputs through the network"
+
+        return self.feed_forward_batch([inputs])[0].tolist()
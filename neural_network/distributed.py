@@ -0,0 +1,590 @@
+"""
+Distributed evaluation of genomes on other machines
+
+The coordinator (DistributedEvaluator, used by NeuroEvolution.use_distributed)
+listens on a TCP port. Workers (run_worker, or ``python -m neural_network
+worker HOST:PORT``) connect to it, import the genome class and evaluate the
+genomes they get sent. Workers can join and leave at any time.
+
+Every message is a frame: a 4 byte length, a 4 byte header length, a json
+header and an optional binary payload (the raw network parameters).
+"""
+
+import collections
+import itertools
+import json
+import os
+import queue
+import selectors
+import socket
+import struct
+import threading
+import time
+import typing
+
+import numpy as np
+
+from .network import NeuralNetwork
+from .genome import Genome
+
+PROTOCOL_VERSION = 1
+DEFAULT_PORT = 4921
+# Seconds between two heartbeats of a worker and after which a silent worker is considered dead
+HEARTBEAT_INTERVAL = 2.0
+TIMEOUT = 10.0
+# Upper limit for the size of a frame (protects against garbage on the port)
+MAX_FRAME_SIZE = 1 << 30
+
+_LENGTH = struct.Struct("!I")
+
+
+class ProtocolError(Exception):
+    "Raised if the other side sends something which doesn't follow the protocol"
+
+
+class WorkerRejected(ConnectionRefusedError):
+    "Raised by run_worker if the coordinator doesn't accept the worker (e.g. wrong token)"
+
+
+def encode_message(header: dict, payload: bytes = b"") -> bytes:
+    "Encode a message as a frame"
+
+    headerbytes = json.dumps(header).encode("utf-8")
+    return _LENGTH.pack(_LENGTH.size + len(headerbytes) + len(payload)) + _LENGTH.pack(len(headerbytes)) + headerbytes + payload
+
+
+def decode_message(frame: bytes) -> typing.Tuple[dict, bytes]:
+    "Decode a frame (without its length) into header and payload"
+
+    headerlength, = _LENGTH.unpack_from(frame)
+    end = _LENGTH.size + headerlength
+    if end > len(frame):
+        raise ProtocolError("Invalid header length!")
+    return json.loads(frame[_LENGTH.size:end].decode("utf-8")), frame[end:]
+
+
+class MessageReader():
+    "Splits a stream of received bytes into messages"
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes) -> typing.List[typing.Tuple[dict, bytes]]:
+        "Add received data and return all messages which are complete now"
+
+        self._buffer += data
+        messages = []
+        while len(self._buffer) >= _LENGTH.size:
+            length, = _LENGTH.unpack_from(self._buffer)
+            if length > MAX_FRAME_SIZE or length < _LENGTH.size:
+                raise ProtocolError(f"Invalid frame length: {length}")
+            if len(self._buffer) < _LENGTH.size + length:
+                break
+            frame = bytes(self._buffer[_LENGTH.size:_LENGTH.size+length])
+            del self._buffer[:_LENGTH.size+length]
+            messages.append(decode_message(frame))
+        return messages
+
+
+def _read_messages(sock: socket.socket, incoming: queue.Queue, stop_requested: threading.Event) -> None:
+    """
+    Put all messages received on a blocking socket into ``incoming``
+
+    Runs on its own thread, so the socket is also read while a task is
+    evaluated. Sets ``stop_requested`` as soon as a stop message arrives.
+    Ends by putting the error which closed the connection into the queue.
+    """
+
+    reader = MessageReader()
+    try:
+        while True:
+            data = sock.recv(1 << 16)
+            if not data:
+                raise ConnectionError("Connection closed")
+            for message in reader.feed(data):
+                if message[0].get("type") == "stop":
+                    stop_requested.set()
+                incoming.put(message)
+    except Exception as e: # pylint: disable=broad-except
+        incoming.put(e)
+
+
+def parse_address(address: str, default_host: str = "127.0.0.1") -> typing.Tuple[str, int]:
+    "Parse 'host:port', 'host' or ':port'"
+
+    host, _, port = address.rpartition(":") if ":" in address else (address, "", "")
+    return host or default_host, int(port) if port else DEFAULT_PORT
+
+
+# Coordinator
+
+class _WorkerConnection():
+    "State of a connected worker (coordinator side)"
+
+    def __init__(self, sock: socket.socket, address):
+        self.sock = sock
+        self.address = address
+        self.name = f"{address[0]}:{address[1]}"
+        self.reader = MessageReader()
+        self.ready = False
+        self.setup = None
+        self.last_seen = time.monotonic()
+        # Ids of the tasks sent to this worker which haven't returned yet
+        self.outstanding: typing.Set[int] = set()
+        # Frames not sent completely yet and how much of the first one has been sent
+        # (the socket is non-blocking: a busy worker doesn't read its tasks)
+        self.outgoing: typing.Deque[bytes] = collections.deque()
+        self.offset = 0
+
+    def send(self, header: dict, payload: bytes = b"") -> None:
+        self.send_frame(encode_message(header, payload))
+
+    def send_frame(self, frame: bytes) -> None:
+        "Queue a frame and send as much as possible without blocking"
+
+        self.outgoing.append(frame)
+        self.flush()
+
+    def flush(self) -> None:
+        "Send queued data until the socket would block (or all of it, if the socket is blocking)"
+
+        while self.outgoing:
+            try:
+                sent = self.sock.send(memoryview(self.outgoing[0])[self.offset:])
+            except BlockingIOError:
+                return
+            self.offset += sent
+            if self.offset == len(self.outgoing[0]):
+                self.outgoing.popleft()
+                self.offset = 0
+
+
+class DistributedEvaluator():
+    """
+    Evaluates genomes on workers connected over TCP
+
+    Starts listening on ``host``/``port`` immediately (port 0: any free
+    port, see ``address``). Every worker gets up to ``prefetch`` tasks at
+    once, so it never waits for the next one. Once no task is left, idle
+    workers get a copy of a task still running elsewhere (work stealing);
+    the first result is used. Workers silent for more than ``timeout``
+    seconds while evaluating, and disconnected workers, are dropped and
+    their tasks are sent to other workers. Tasks are sent without blocking,
+    so a worker still busy with its previous task doesn't stop the others.
+
+    The genome class must be importable by the workers and the genome
+    setup arguments json-serializable. If ``token`` is set, workers must
+    send the same token to be accepted. Note that the connection is not
+    encrypted.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT, prefetch: int = 2,
+                 timeout: float = TIMEOUT, steal: bool = True, token: str = None):
+        self.prefetch = prefetch
+        self.timeout = timeout
+        self.steal = steal
+        self.token = token
+
+        self._listener = socket.create_server((host, port))
+        self._listener.setblocking(False)
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._listener, selectors.EVENT_READ, None)
+
+        self.workers: typing.List[_WorkerConnection] = []
+        self._taskids = itertools.count()
+
+    @property
+    def address(self) -> typing.Tuple[str, int]:
+        "Host and port the coordinator is listening on"
+
+        return self._listener.getsockname()[:2]
+
+    def clone_network(self, trainer, network: NeuralNetwork) -> NeuralNetwork: # pylint: disable=unused-argument
+        "Copy a network for the next generation"
+
+        return network.clone()
+
+    def _get_setup(self, trainer) -> dict:
+        "Get the setup message for the workers"
+
+        genome_class = trainer.genome_class
+        if genome_class.__module__ == "__main__":
+            raise ValueError("The genome class must be importable by the workers (not defined in __main__)!")
+
+        setup = {
+            "type": "setup",
+            "genome_class": f"{genome_class.__module__}:{genome_class.__qualname__}",
+            "args": list(trainer.genome_setup_args),
+            "kwargs": trainer.genome_setup_kwargs,
+            "reuse_genomes": trainer.reuse_genomes,
+        }
+        try:
+            json.dumps(setup)
+        except TypeError as e:
+            raise ValueError("The genome setup arguments must be json-serializable!") from e
+        return setup
+
+    # Connections
+
+    def _accept(self) -> None:
+        "Accept a new worker (it becomes ready after its hello message)"
+
+        try:
+            sock, address = self._listener.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        worker = _WorkerConnection(sock, address)
+        self.workers.append(worker)
+        self._selector.register(sock, selectors.EVENT_READ, worker)
+
+    def _update_events(self, worker: _WorkerConnection) -> None:
+        "Also wait until the socket is writable while data of a worker is queued"
+
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if worker.outgoing else 0)
+        if self._selector.get_key(worker.sock).events != events:
+            self._selector.modify(worker.sock, events, worker)
+
+    def _drop(self, worker: _WorkerConnection, reason: str) -> typing.Set[int]:
+        "Close the connection to a worker and return the ids of its unfinished tasks"
+
+        if worker.ready:
+            print(f"Worker {worker.name} dropped: {reason}")
+        self._selector.unregister(worker.sock)
+        worker.sock.close()
+        self.workers.remove(worker)
+        return worker.outstanding
+
+    def _receive(self, worker: _WorkerConnection) -> typing.List[typing.Tuple[dict, bytes]]:
+        "Read the available messages of a worker"
+
+        try:
+            data = worker.sock.recv(1 << 16)
+        except BlockingIOError:
+            return []
+        if not data:
+            raise ConnectionError("Connection closed")
+        worker.last_seen = time.monotonic()
+        return worker.reader.feed(data)
+
+    def _handle_hello(self, worker: _WorkerConnection, header: dict) -> None:
+        "Check the hello message of a new worker"
+
+        reason = None
+        if header.get("type") != "hello" or header.get("version") != PROTOCOL_VERSION:
+            reason = "Invalid hello message or protocol version!"
+        elif self.token is not None and header.get("token") != self.token:
+            reason = "Invalid token!"
+        if reason is not None:
+            worker.send({"type": "rejected", "reason": reason})
+            raise ProtocolError(reason)
+        worker.name = f"{header.get('host', worker.address[0])}/{header.get('pid')}"
+        worker.ready = True
+        print(f"Worker {worker.name} connected")
+
+    # Evaluation
+
+    def evaluate(self, trainer, genomes: typing.List[Genome]) -> None:
+        "Evaluate the genomes on the workers and store their scores"
+
+        # Imported here, so workers don't have to import tqdm
+        from tqdm import tqdm # pylint: disable=import-outside-toplevel
+
+        if not genomes:
+            return
+
+        setup = self._get_setup(trainer)
+
+        # Task id -> index of the genome, for the tasks of this call only
+        tasks = {next(self._taskids): index for index in range(len(genomes))}
+        messages = {taskid: self._encode_task(taskid, genomes[index].network, trainer.generation)
+                    for taskid, index in tasks.items()}
+        pending = collections.deque(tasks)
+        copies = collections.Counter()
+        dispatched = {}
+        done = set()
+
+        if not any(worker.ready for worker in self.workers):
+            print(f"Waiting for workers on {self.address[0]}:{self.address[1]}...")
+
+        with tqdm(total=len(genomes), desc=f"Generation {trainer.generation}") as progress:
+            while len(done) < len(tasks):
+                lost = set()
+
+                # Send tasks to all workers with free capacity
+                for worker in list(self.workers):
+                    if not worker.ready:
+                        continue
+                    try:
+                        if worker.setup != setup:
+                            worker.send(setup)
+                            worker.setup = setup
+                        while len(worker.outstanding) < self.prefetch:
+                            taskid = self._next_task(worker, pending, copies, dispatched, done)
+                            if taskid is None:
+                                break
+                            # Registered before sending, so the task is sent again if the worker is lost
+                            if not worker.outstanding:
+                                worker.last_seen = time.monotonic()
+                            worker.outstanding.add(taskid)
+                            copies[taskid] += 1
+                            dispatched.setdefault(taskid, time.monotonic())
+                            worker.send_frame(messages[taskid])
+                        self._update_events(worker)
+                    except OSError as e:
+                        lost |= self._drop(worker, str(e))
+
+                # Send queued data and receive results
+                for key, events in self._selector.select(timeout=0.2):
+                    worker = key.data
+                    if worker is None:
+                        self._accept()
+                        continue
+                    if worker not in self.workers:
+                        continue
+                    try:
+                        if events & selectors.EVENT_WRITE:
+                            worker.flush()
+                            self._update_events(worker)
+                        if not events & selectors.EVENT_READ:
+                            continue
+                        received = self._receive(worker)
+                        for header, _ in received:
+                            if not worker.ready:
+                                self._handle_hello(worker, header)
+                            elif header.get("type") == "result":
+                                taskid = header["id"]
+                                worker.outstanding.discard(taskid)
+                                copies[taskid] -= 1
+                                if taskid in tasks and taskid not in done:
+                                    done.add(taskid)
+                                    genome = genomes[tasks[taskid]]
+                                    genome.score = header["score"]
+                                    genome.evaluation_time = header["seconds"]
+                                    trainer.metrics.add_evaluation(header["seconds"], header["forward_passes"])
+                                    progress.update(1)
+                                    trainer._report_progress(len(done), len(tasks)) # pylint: disable=protected-access
+                            elif header.get("type") == "error":
+                                worker.outstanding.discard(header["id"])
+                                copies[header["id"]] -= 1
+                                if header["id"] in tasks:
+                                    raise RuntimeError(f"Evaluation failed on worker {worker.name}: {header.get('message')}")
+                    except (OSError, ProtocolError, ValueError, KeyError) as e:
+                        lost |= self._drop(worker, str(e))
+
+                # Drop workers which stopped responding
+                now = time.monotonic()
+                for worker in list(self.workers):
+                    if worker.outstanding and now - worker.last_seen > self.timeout:
+                        lost |= self._drop(worker, "timed out")
+
+                # Send the tasks of lost workers again (unless a copy is still running elsewhere)
+                for taskid in lost:
+                    copies[taskid] -= 1
+                    if taskid in tasks and taskid not in done and copies[taskid] <= 0:
+                        pending.appendleft(taskid)
+
+                if trainer._interrupt.is_set(): # pylint: disable=protected-access
+                    trainer._report_progress(len(done), len(tasks)) # pylint: disable=protected-access
+
+    def _encode_task(self, taskid: int, network: NeuralNetwork, generation: int) -> bytes:
+        "Encode the task of evaluating a network"
+
+        header = {
+            "type": "task",
+            "id": taskid,
+            "generation": generation,
+            "sizes": network.sizes,
+            "actfuncs": network.actfuncs,
+            "dtype": network.dtype.str,
+        }
+        if network.mask is not None:
+            header["mask"] = network.packed_mask
+        try:
+            return encode_message(header, network.params.tobytes())
+        except TypeError as e:
+            raise ValueError("Custom activation functions can't be sent to workers!") from e
+
+    def _next_task(self, worker: _WorkerConnection, pending: collections.deque, copies: collections.Counter,
+                   dispatched: dict, done: set) -> typing.Optional[int]:
+        "Get the next task to send to a worker, or None if there is none"
+
+        if pending:
+            return pending.popleft()
+
+        if not self.steal or worker.outstanding:
+            return None
+
+        # Work stealing: help with the longest running task not running twice yet
+        candidates = [
+            taskid for taskid in dispatched
+            if taskid not in done and copies[taskid] == 1 and taskid not in worker.outstanding
+        ]
+        if not candidates:
+            return None
+        return min(candidates, key=dispatched.get)
+
+    def close(self) -> None:
+        """
+        Stop all workers and stop listening
+
+        Waits up to ``timeout`` seconds for the workers to receive the stop
+        message and close their connection.
+        """
+
+        deadline = time.monotonic() + self.timeout
+        for worker in self.workers:
+            # Only finish sending the frame already started
+            if worker.offset:
+                worker.outgoing = collections.deque([worker.outgoing[0]])
+            else:
+                worker.outgoing.clear()
+            try:
+                worker.sock.settimeout(max(deadline - time.monotonic(), 0))
+                worker.send({"type": "stop"})
+                worker.sock.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass
+
+        for worker in self.workers:
+            # Closing with unread data (e.g. heartbeats) would reset the connection
+            # and could discard the stop message before the worker has read it
+            try:
+                worker.sock.settimeout(max(deadline - time.monotonic(), 0))
+                while worker.sock.recv(1 << 16):
+                    pass
+            except OSError:
+                pass
+            self._selector.unregister(worker.sock)
+            worker.sock.close()
+        self.workers = []
+        self._selector.unregister(self._listener)
+        self._listener.close()
+        self._selector.close()
+
+
+# Worker
+
+def _import_genome_class(path: str):
+    "Import the genome class sent by the coordinator"
+
+    # Imported here, so the command line interface can import this module cheaply
+    from .cli import import_object # pylint: disable=import-outside-toplevel
+
+    return import_object(path)
+
+
+def _send_heartbeats(sock: socket.socket, lock: threading.Lock, stopped: threading.Event, interval: float) -> None:
+    "Send a heartbeat every ``interval`` seconds until ``stopped`` is set"
+
+    while not stopped.wait(interval):
+        try:
+            with lock:
+                sock.sendall(encode_message({"type": "heartbeat"}))
+        except OSError:
+            return
+
+
+def _serve(sock: socket.socket, token: str, heartbeat_interval: float) -> bool:
+    "Evaluate the tasks of a coordinator - returns True if it sent a stop message"
+
+    incoming = queue.Queue()
+    lock = threading.Lock()
+    stopped = threading.Event()
+    stop_requested = threading.Event()
+
+    def send(header: dict) -> None:
+        with lock:
+            sock.sendall(encode_message(header))
+
+    send({"type": "hello", "version": PROTOCOL_VERSION, "token": token,
+          "host": socket.gethostname(), "pid": os.getpid()})
+    threading.Thread(target=_send_heartbeats, args=(sock, lock, stopped, heartbeat_interval), daemon=True).start()
+    threading.Thread(target=_read_messages, args=(sock, incoming, stop_requested), daemon=True).start()
+
+    setup = None
+    genome = None
+    try:
+        while True:
+            message = incoming.get()
+            if isinstance(message, Exception):
+                raise message
+            header, payload = message
+
+            # Tasks queued before the stop message aren't evaluated anymore
+            if header["type"] == "stop" or stop_requested.is_set():
+                return True
+            if header["type"] == "rejected":
+                raise WorkerRejected(header.get("reason"))
+            if header["type"] == "setup":
+                setup = header
+                setup["genome_class"] = _import_genome_class(header["genome_class"])
+                genome = None
+                continue
+            if header["type"] != "task" or setup is None:
+                raise ProtocolError(f"Unexpected message: {header.get('type')}")
+
+            try:
+                params = np.frombuffer(payload, dtype=np.dtype(header["dtype"]))
+                network = NeuralNetwork.from_params(header["sizes"], params, header["actfuncs"], header.get("mask"))
+                if genome is not None and setup["reuse_genomes"]:
+                    genome.reset(network)
+                else:
+                    genome = setup["genome_class"](network)
+                    genome.setup(*setup["args"], **setup["kwargs"])
+
+                start = time.perf_counter()
+                genome.run_evaluation(header["generation"])
+                seconds = time.perf_counter() - start
+                score = float(genome.score)
+            except Exception as e: # pylint: disable=broad-except
+                # The coordinator raises the error, the worker stays available
+                if stop_requested.is_set():
+                    return True
+                send({"type": "error", "id": header["id"], "message": f"{type(e).__name__}: {e}"})
+                genome = None
+                continue
+
+            # The coordinator may already have closed the connection after the stop message
+            if stop_requested.is_set():
+                return True
+            send({"type": "result", "id": header["id"], "score": score, "seconds": seconds,
+                  "forward_passes": network.forward_passes})
+    finally:
+        stopped.set()
+
+
+def run_worker(host: str = "127.0.0.1", port: int = DEFAULT_PORT, token: str = None,
+               connect_timeout: float = 60.0, heartbeat_interval: float = HEARTBEAT_INTERVAL) -> None:
+    """
+    Connect to a coordinator and evaluate genomes until it stops the worker
+
+    Retries connecting for ``connect_timeout`` seconds, also after the
+    connection has been lost (e.g. if the coordinator restarts).
+    """
+
+    while True:
+        deadline = time.monotonic() + connect_timeout
+        while True:
+            try:
+                sock = socket.create_connection((host, port))
+                break
+            except OSError:
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(1)
+
+        print(f"Connected to {host}:{port}")
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        try:
+            if _serve(sock, token, heartbeat_interval):
+                print("Stopped by the coordinator")
+                return
+        except WorkerRejected:
+            raise
+        except (ConnectionError, ProtocolError) as e:
+            print(f"Connection lost: {e}")
+        finally:
+            sock.close()
@@ -0,0 +1,75 @@
+"Caching of genome scores"
+
+import collections
+import hashlib
+import json
+
+from .network import NeuralNetwork
+
+
+class FitnessCache():
+    """
+    LRU cache of scores, keyed by a hash of the network parameters
+
+    Used by NeuroEvolution to skip the evaluation of networks which have
+    already been evaluated (e.g. the unmutated best genomes). Only valid
+    for deterministic fitness functions which do not depend on the generation.
+
+    If ``stochastic`` is True, networks are evaluated every time and the
+    cache keeps the mean score of all evaluations of a network instead,
+    which is then used as the score of the genome.
+    """
+
+    def __init__(self, maxsize: int = 1000, stochastic: bool = False):
+        self.maxsize = maxsize
+        self.stochastic = stochastic
+        self.hits = 0
+        self.misses = 0
+
+        # key -> (score, number of evaluations)
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def get_key(network: NeuralNetwork) -> bytes:
+        "Get the cache key of a network"
+
+        key = hashlib.blake2b(digest_size=16)
+        # Custom activation functions (callables) are identified by their repr (including their address)
+        key.update(json.dumps([network.sizes, network.actfuncs], default=repr).encode("utf-8"))
+        key.update(network.params.tobytes())
+        return key.digest()
+
+    def get(self, key: bytes):
+        "Get the cached score (None if not cached or if the cache is stochastic)"
+
+        if self.stochastic or key not in self._entries:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return self._entries[key][0]
+
+    def put(self, key: bytes, score) -> float:
+        "Store the score of an evaluation - returns the score to use (the mean if stochastic)"
+
+        if self.stochastic and key in self._entries:
+            mean, count = self._entries[key]
+            score = mean + (score - mean) / (count + 1)
+            self._entries[key] = (score, count + 1)
+        else:
+            self._entries[key] = (score, 1)
+
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+        return score
+
+    def clear(self) -> None:
+        "Remove all entries"
+
+        self._entries.clear()
@@ -4,23 +4,84 @@ from .network import NeuralNetwork
 class Genome():
     "Genome - must be subclassed"
 
+    # Set to True in subclasses implementing the lockstep_* methods below:
+    # NeuroEvolution then evaluates all genomes of a population together,
+    # tick by tick, with one batched forward pass per tick for all of them.
+    LOCKSTEP = False
+
+    # Set to True in subclasses implementing the budget_* methods below:
+    # NeuroEvolution can then evaluate genomes in rounds of increasing budget
+    # and stop evaluating the worst ones early (see NeuroEvolution.halving_rounds).
+    BUDGET = False
+
     def __init__(self, network: NeuralNetwork):
         self.network = network
         self.obj = None
+        self._score = None
+        # Duration of the last evaluation in seconds (if measured)
+        self.evaluation_time = None
+        # Fraction of the full evaluation the score is based on (None: full evaluation)
+        self.evaluation_budget = None
 
     def setup(self, *args, **kwargs):
         raise NotImplementedError
 
+    def reset(self, network: NeuralNetwork):
+        """
+        Reuse the genome for another network (see NeuroEvolution.reuse_genomes)
+
+        Clears the score of the last evaluation - override to also reset the
+        environment in ``obj`` (and call this method) if run_evaluation doesn't.
+        """
+        self.network = network
+        self._score = None
+        self.evaluation_time = None
+        self.evaluation_budget = None
+
     def run_evaluation(self, generation: int = None):
         raise NotImplementedError
 
+    def lockstep_start(self, generation: int = None):
+        "LOCKSTEP: Prepare a new evaluation (instead of run_evaluation)"
+        raise NotImplementedError
+
+    def lockstep_observe(self):
+        "LOCKSTEP: Return the network inputs for the next tick, or None if the evaluation is done"
+        raise NotImplementedError
+
+    def lockstep_act(self, outputs):
+        "LOCKSTEP: Act on the network outputs for the inputs of the last lockstep_observe call"
+        raise NotImplementedError
+
+    def budget_start(self, generation: int = None):
+        "BUDGET: Prepare a new evaluation (instead of run_evaluation)"
+        raise NotImplementedError
+
+    def budget_continue(self, budget: float):
+        """
+        BUDGET: Continue the evaluation until ``budget`` (a fraction between 0
+        and 1) of the full evaluation is done - the score must then be the
+        partial score so far, and with a budget of 1 the same as after run_evaluation
+        """
+        raise NotImplementedError
+
     def feed_forward(self, data):
         return self.network.feed_forward(data)
 
+    def feed_forward_batch(self, data):
+        return self.network.feed_forward_batch(data)
+
     @property
     def score(self):
+        # Set if the evaluation happened elsewhere (e.g. in a worker process)
+        if self._score is not None:
+            return self._score
         if hasattr(self.obj, "score"):
             if callable(self.obj.score):
                 return self.obj.score()
             return self.obj.score
         raise NotImplementedError
+
+    @score.setter
+    def score(self, value):
+        self._score = value
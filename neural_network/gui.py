@@ -1,16 +1,37 @@
+import queue
+import threading
+import traceback
 import tkinter
 
+from .training import GenerationInterrupted
+
+# Interval in milliseconds in which the GUI checks for messages of the training thread
+POLL_INTERVAL = 100
+
 class TrainingGUI(tkinter.Tk):
+    """
+    GUI for running a NeuroEvolution trainer
+
+    Training runs on a separate thread, which only sends messages to the GUI
+    through a queue. The GUI reads them every POLL_INTERVAL milliseconds, so
+    redrawing never slows down the training.
+    """
+
     def __init__(self, trainer, alwaysontop=True, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
         self._nn_trainer = trainer
+        self._nn_thread = None
+        self._nn_queue = queue.Queue()
+        # Set once nn_afterrun has run for the last generation
+        self._nn_afterrun_done = threading.Event()
 
         self.title("Neural Training GUI - by rafaelurben")
         self.resizable(False, False)
         self.configure(background='#000')
 
         self._nn_interrupted = False
+        self._nn_failed = False
 
         # Settings
 
@@ -34,8 +55,8 @@ class TrainingGUI(tkinter.Tk):
 
         h = len(trainer.EDITABLE_FIELDS)+2
 
-        btn = tkinter.Button(self, text="Save", command=self._nn_save)
-        btn.grid(row=h, column=2, columnspan=2, sticky="ne", pady=10, padx=10)
+        self._nn_b_save = tkinter.Button(self, text="Save", command=self._nn_save)
+        self._nn_b_save.grid(row=h, column=2, columnspan=2, sticky="ne", pady=10, padx=10)
         h += 1
 
         # Runner
@@ -97,6 +118,15 @@ class TrainingGUI(tkinter.Tk):
         self._nn_l_state.configure(font=("Arial", 12))
         self._nn_l_state.grid(row=h, column=2, columnspan=2, sticky="w", padx=10)
         h += 1
+
+        label = tkinter.Label(self, text="Progress", bg='#000', fg='#FFF')
+        label.configure(font=("Arial", 12))
+        label.grid(row=h, column=0, columnspan=2, sticky="w", padx=10)
+
+        self._nn_l_progress = tkinter.Label(self, text="-", bg='#000', fg='#FFF')
+        self._nn_l_progress.configure(font=("Arial", 12))
+        self._nn_l_progress.grid(row=h, column=2, columnspan=2, sticky="w", padx=10)
+        h += 1
         
         label = tkinter.Label(self, text="Folder", bg='#000', fg='#FFF')
         label.configure(font=("Arial", 12))
@@ -120,64 +150,161 @@ class TrainingGUI(tkinter.Tk):
         if alwaysontop:
             self.call('wm', 'attributes', '.', '-topmost', '1')
 
+        self.protocol("WM_DELETE_WINDOW", self._nn_close)
+
     def _nn_interrupt(self):
         self._nn_interrupted = True
+        self._nn_trainer.request_interrupt()
+        self._nn_l_state.configure(text="Interrupting...")
         print("Interrupting...")
 
+    def _nn_close(self):
+        if self._nn_thread is not None and self._nn_thread.is_alive():
+            # Let the training thread stop first (it restores the last finished generation)
+            if not self._nn_interrupted:
+                self._nn_interrupt()
+            self.after(POLL_INTERVAL, self._nn_close)
+            return
+        self.destroy()
+
     def _nn_save(self):
+        # The trainer must not change while a generation runs on the training thread
+        if self._nn_thread is not None and self._nn_thread.is_alive():
+            return
+
         for name, entry in self._nn_entryfields.items():
             tp = type(getattr(self._nn_trainer, name))
             setattr(self._nn_trainer, name, tp(entry.get()))
         print("Updated settings!")
 
     def nn_afterrun(self):
-        ...
+        """
+        Called after every generation - can be overridden (e.g. to save the trainer)
+
+        Runs on the GUI thread, so it can update widgets. If overridden, the
+        next generation only starts once it has returned.
+        """
+
+    def nn_afterrun_background(self):
+        """
+        Called after every generation on the training thread - can be overridden
+
+        For work which doesn't touch any widgets: the GUI stays responsive
+        while it runs. Called before nn_afterrun has returned.
+        """
+
+    def _nn_has_afterrun(self):
+        "Whether nn_afterrun is overridden (otherwise the training thread doesn't wait for it)"
+        return type(self).nn_afterrun is not TrainingGUI.nn_afterrun
 
     def _nn_run_n_times(self, count):
+        if self._nn_thread is not None and self._nn_thread.is_alive():
+            return
+
         self._nn_interrupted = False
+        self._nn_failed = False
 
         self._nn_l_state.configure(text="Training next...")
 
         self._nn_e_runs.config(state="disabled")
+        self._nn_b_save.config(state="disabled")
         self._nn_b_interrupt.config(state="normal")
         self._nn_b_run_once.config(state="disabled")
         self._nn_b_run_entry_times.config(state="disabled")
         self._nn_b_run_infinite.config(state="disabled")
-        self.update()
 
-        while count > 0:
-            if self._nn_interrupted:
-                print("Interrupted!")
+        self._nn_thread = threading.Thread(target=self._nn_train, args=(count,), daemon=True)
+        self._nn_thread.start()
+        self.after(POLL_INTERVAL, self._nn_poll)
+
+    def _nn_train(self, count):
+        "Training thread - must not touch any widgets, only sends messages to the queue"
+
+        def report_progress(evaluated, total):
+            self._nn_queue.put(("progress", evaluated, total))
+
+        self._nn_trainer.progress_callbacks.append(report_progress)
+        try:
+            while count > 0:
+                if self._nn_interrupted:
+                    print("Interrupted!")
+                    break
+
+                self._nn_queue.put(("runs", count))
+
+                highscore = self._nn_trainer.run_generation()
+                self._nn_afterrun_done.clear()
+                self._nn_queue.put(("generation", self._nn_trainer.generation, highscore))
+
+                self.nn_afterrun_background()
+                if self._nn_has_afterrun():
+                    # nn_afterrun is called by _nn_poll on the GUI thread
+                    self._nn_afterrun_done.wait()
+
+                count -= 1
+        except GenerationInterrupted:
+            print("Interrupted!")
+        except Exception: # pylint: disable=broad-except
+            traceback.print_exc()
+            self._nn_queue.put(("error",))
+        finally:
+            self._nn_trainer.progress_callbacks.remove(report_progress)
+            self._nn_queue.put(("done",))
+
+    def _nn_poll(self):
+        "Apply the messages of the training thread to the widgets"
+
+        done = False
+        progress = None
+        while True:
+            try:
+                message = self._nn_queue.get_nowait()
+            except queue.Empty:
                 break
 
-            self._nn_e_runs.config(state="normal")
-            self._nn_e_runs.delete(0, tkinter.END)
-            self._nn_e_runs.insert(0, str(count))
-            self._nn_e_runs.config(state="disabled")
-            self.update()
-
-            highscore = self._nn_trainer.run_generation()
-            generation = self._nn_trainer.generation
-
-            self._nn_l_generation.configure(text=str(generation))
-            self._nn_l_score.configure(text=str(highscore))
-            self.update()
-
-            self.nn_afterrun()
-
-            count -= 1
-
-
+            kind = message[0]
+            if kind == "progress":
+                # Only the latest progress is shown
+                progress = message[1:]
+            elif kind == "runs":
+                self._nn_e_runs.config(state="normal")
+                self._nn_e_runs.delete(0, tkinter.END)
+                self._nn_e_runs.insert(0, str(message[1]))
+                self._nn_e_runs.config(state="disabled")
+            elif kind == "generation":
+                self._nn_l_generation.configure(text=str(message[1]))
+                self._nn_l_score.configure(text=str(message[2]))
+                try:
+                    self.nn_afterrun()
+                except Exception: # pylint: disable=broad-except
+                    traceback.print_exc()
+                finally:
+                    self._nn_afterrun_done.set()
+            elif kind == "error":
+                self._nn_failed = True
+            elif kind == "done":
+                done = True
+
+        if progress is not None:
+            self._nn_l_progress.configure(text=f"{progress[0]}/{progress[1]} genomes")
+
+        if done:
+            self._nn_finish()
+        else:
+            self.after(POLL_INTERVAL, self._nn_poll)
+
+    def _nn_finish(self):
         self._nn_e_runs.config(state="normal")
+        self._nn_b_save.config(state="normal")
         self._nn_b_interrupt.config(state="disabled")
         self._nn_b_run_once.config(state="normal")
         self._nn_b_run_entry_times.config(state="normal")
         self._nn_b_run_infinite.config(state="normal")
 
-        self._nn_l_state.configure(text="Idle.")
+        self._nn_l_state.configure(text="Error! (see console)" if self._nn_failed else "Idle.")
+        self._nn_l_progress.configure(text="-")
         self._nn_e_runs.delete(0, tkinter.END)
         self._nn_e_runs.insert(0, "0")
-        self.update()
 
     def _nn_run_once(self):
         self._nn_run_n_times(1)
@@ -1,27 +1,72 @@
 "Evaluation"
 
+import os
 import json
 
+import numpy as np
+
 from .network import NeuralNetwork
+from .compiled import CompiledNetwork
+from .quantized import QuantizedNetwork
 from .manager import NeuralManager
+from .binaryformat import read_binary
 
 class NeuroLoader(NeuralManager):
-    "Class used to load a NeuralNetwork from a NeuralManager export"
+    """
+    Class used to load a NeuralNetwork from a NeuralManager export
+
+    If ``binary`` is None, the newer one of the binary and the json export
+    is used. Binary exports are memory-mapped read-only: the weights
+    are views into the file, so loading takes the same time for any network
+    size and all processes loading the same file share its memory pages.
+    """
 
-    def __init__(self, name="neuro", folder="../data/"):
+    def __init__(self, name="neuro", folder="../data/", binary: bool = None):
         super().__init__(name, folder)
 
-        filename = self._get_filename(for_export=True)
+        if binary is None:
+            binarypath = folder+self._get_filename(for_export=True, binary=True)
+            jsonpath = folder+self._get_filename(for_export=True, binary=False)
+            binary = os.path.exists(binarypath) and (
+                not os.path.exists(jsonpath) or os.path.getmtime(binarypath) >= os.path.getmtime(jsonpath))
+
+        filename = self._get_filename(for_export=True, binary=binary)
 
         print(f"Loading from '{filename}'...", end=" ")
 
-        with open(folder+filename, "r", encoding="utf-8") as file:
-            data = json.loads(file.read())
+        if binary:
+            data, params = read_binary(folder+filename, mmap_mode="r")
+            self.network = NeuralNetwork.from_params(data["sizes"], params[0], data["actfuncs"], data.get("mask"))
+        else:
+            with open(folder+filename, "r", encoding="utf-8") as file:
+                data = json.loads(file.read())
+            self.network = NeuralNetwork.from_dict(data["network"])
 
         self.generation = data["generation"]
         print(f"Found generation {self.generation}!")
 
-        self.network = NeuralNetwork.from_dict(data["network"])
+    def compile(self, dtype=np.float32, fuse: bool = True) -> CompiledNetwork:
+        "Get a CompiledNetwork of the stored network (for fast inference)"
+
+        return self.network.compile(dtype, fuse)
+
+    def quantize(self, calibration_inputs=None, per_row: bool = True, fuse: bool = True) -> QuantizedNetwork:
+        """
+        Get a QuantizedNetwork of the stored network (int8 weights, for inference)
+
+        If ``calibration_inputs`` (one row per sample) are given, the error
+        compared to the float network is measured on them and printed.
+        """
+
+        quantized = self.network.quantize(per_row, fuse, calibration_inputs)
+        if quantized.report is not None:
+            report = quantized.report
+            print(f"Quantized: max error {report['max_abs_error']:.6g} "
+                  f"({report['max_relative_error']:.3%} of the output range), "
+                  f"mean error {report['mean_abs_error']:.6g}, "
+                  f"same largest output for {report['argmax_agreement']:.2%} of {report['samples']} samples, "
+                  f"{report['nbytes_float32'] / report['nbytes']:.1f}x smaller than float32")
+        return quantized
 
     def get_genome(self, genome_class, *genome_setup_args,  **genome_setup_kwargs):
         "Create a genome with the selected options and the stored network"
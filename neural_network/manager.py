@@ -1,7 +1,13 @@
 import os
 import json
 
+import numpy as np
+
 from .network import NeuralNetwork
+from .binaryformat import read_binary, write_binary
+
+EXTENSION_JSON = ".json"
+EXTENSION_BINARY = ".bin"
 
 
 class NeuralManager():
@@ -14,29 +20,56 @@ class NeuralManager():
 
         os.makedirs(self.folder, exist_ok=True)
 
-    def _get_filename(self, for_export=False) -> str:
+    def _get_filename(self, for_export=False, binary=False) -> str:
+        extension = EXTENSION_BINARY if binary else EXTENSION_JSON
         if for_export:
-            return f"neuro-{self.name}-export.json"
-        return f"neuro-{self.name}-gen{str(self.generation).zfill(3)}.json"
+            return f"neuro-{self.name}-export{extension}"
+        return f"neuro-{self.name}-gen{str(self.generation).zfill(3)}{extension}"
+
+    def _list_generation_filenames(self) -> dict:
+        "Get the filenames of all saved generations (generation -> list of filenames)"
 
-    def _find_latest_filename(self) -> str:
         files = os.listdir(self.folder)
         filestart = f"neuro-{self.name}-gen"
-        generations = [int(f.split(filestart)[1].split(".json")[0])
-                       for f in files if f.startswith(filestart) and f.endswith(".json")]
-        if not generations:
+        filenames = {}
+        for f in files:
+            if not f.startswith(filestart):
+                continue
+            generation, extension = os.path.splitext(f[len(filestart):])
+            if not generation.isdigit() or extension not in (EXTENSION_JSON, EXTENSION_BINARY):
+                continue
+            filenames.setdefault(int(generation), []).append(f)
+        return filenames
+
+    def _find_latest_filename(self) -> str:
+        filenames = self._list_generation_filenames()
+        if not filenames:
             raise FileNotFoundError(
-                f"No files found in '{self.folder}' with prefix '{filestart}'")
-        youngest = max(generations)
-        return f"neuro-{self.name}-gen{str(youngest).zfill(3)}.json"
+                f"No files found in '{self.folder}' with prefix 'neuro-{self.name}-gen'")
+        # If both formats exist for a generation, use the newer file (the binary one if equally old, as NeuroLoader)
+        return max(filenames[max(filenames)],
+                   key=lambda f: (os.path.getmtime(self.folder+f), f.endswith(EXTENSION_BINARY)))
+
+    def _remove_old_files(self, keep_last: int) -> None:
+        "Remove the saves of all but the ``keep_last`` latest generations"
+
+        filenames = self._list_generation_filenames()
+        for generation in sorted(filenames)[:-keep_last or None]:
+            for filename in filenames[generation]:
+                os.remove(self.folder+filename)
 
     def _load_data_from_file(self, filename: str = None) -> dict:
         filename = filename or self._find_latest_filename()
 
         print(f"Loading from file '{filename}'...", end=" ")
 
-        with open(self.folder+filename, "r", encoding="utf-8") as file:
-            data = json.loads(file.read())
+        if filename.endswith(EXTENSION_BINARY):
+            # Copy-on-write memory map: changes never end up in the file
+            header, params = read_binary(self.folder+filename, mmap_mode="c")
+            data = {**header, "params": params}
+        else:
+            with open(self.folder+filename, "r", encoding="utf-8") as file:
+                data = json.loads(file.read())
 
         self.generation = data["generation"]
         print(f"Found generation {self.generation}!")
@@ -53,24 +86,62 @@ class NeuralManager():
             **data
         }
 
-        with open(self.folder+filename, "w", encoding="utf-8") as file:
+        # Write to a temporary file first, so an interrupted save never leaves a broken file behind
+        with open(self.folder+filename+".tmp", "w", encoding="utf-8") as file:
             json.dump(data, file, indent=4)
+        os.replace(self.folder+filename+".tmp", self.folder+filename)
 
         print("Saved!")
 
-    def _export_network_to_file(self, network: NeuralNetwork, filename: str = None) -> None:
-        filename = filename or self._get_filename(for_export=True)
+    def _save_binary_state_to_file(self, data: dict, params: np.ndarray, filename: str = None) -> None:
+        "Save a header and the parameters of many networks (one row per network) in the binary format"
 
-        print(f"Exporting network to file '{filename}'...", end=" ")
+        filename = filename or self._get_filename(binary=True)
+
+        print(f"Saving state to file '{filename}'...", end=" ")
 
         data = {
-            "_info": "NeuralNetwork export - can be used for evaluating/using the network",
+            "_info": "NeuralManager binary save - can be used to continue training",
             "_generated_by": "https://github.com/rafaelurben/python-neural-network",
-            "generation": self.generation,
-            "network": network.to_dict()
+            **data
         }
 
-        with open(self.folder+filename, "w", encoding="utf-8") as file:
-            json.dump(data, file, indent=4)
+        with open(self.folder+filename+".tmp", "wb") as file:
+            write_binary(file, data, params)
+        os.replace(self.folder+filename+".tmp", self.folder+filename)
+
+        print("Saved!")
+
+    def _export_network_to_file(self, network: NeuralNetwork, filename: str = None, binary: bool = False) -> None:
+        filename = filename or self._get_filename(for_export=True, binary=binary)
+
+        print(f"Exporting network to file '{filename}'...", end=" ")
+
+        if binary:
+            data = {
+                "_info": "NeuralNetwork binary export - can be used for evaluating/using the network",
+                "_generated_by": "https://github.com/rafaelurben/python-neural-network",
+                "generation": self.generation,
+                "sizes": network.sizes,
+                "actfuncs": network.actfuncs,
+            }
+            if network.mask is not None:
+                data["mask"] = network.packed_mask
+
+            # Write to a temporary file first: loaders may have the old file memory-mapped,
+            # replacing it keeps their (now unlinked) copy intact
+            with open(self.folder+filename+".tmp", "wb") as file:
+                write_binary(file, data, network.params[np.newaxis])
+        else:
+            data = {
+                "_info": "NeuralNetwork export - can be used for evaluating/using the network",
+                "_generated_by": "https://github.com/rafaelurben/python-neural-network",
+                "generation": self.generation,
+                "network": network.to_dict()
+            }
+
+            with open(self.folder+filename+".tmp", "w", encoding="utf-8") as file:
+                json.dump(data, file, indent=4)
+        os.replace(self.folder+filename+".tmp", self.folder+filename)
 
         print("Exported!")
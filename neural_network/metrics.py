@@ -0,0 +1,70 @@
+"Per-generation metrics"
+
+import contextlib
+import time
+import typing
+
+import numpy as np
+
+
+class GenerationMetrics():
+    """
+    Timings and statistics of one generation
+
+    ``phases`` contains the wall time (seconds) of each phase of the generation
+    ("generate", "evaluate", "sort" and "checkpoint"), ``evaluation_times``
+    the time of each individual genome evaluation (if measurable - not for
+    lockstep evaluations or cached scores).
+    """
+
+    def __init__(self, generation: int):
+        self.generation = generation
+        self.highscore = None
+        self.phases: typing.Dict[str, float] = {}
+        self.evaluation_times: typing.List[float] = []
+        self.evaluations = 0
+        self.forward_passes = 0
+        self.wall_time = 0.0
+        self.slowest: typing.List[dict] = []
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        "Measure the duration of a phase (added up if the phase runs multiple times)"
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def add_evaluation(self, seconds: float = None, forward_passes: int = 0) -> None:
+        "Record the evaluation of a genome"
+
+        self.evaluations += 1
+        self.forward_passes += forward_passes
+        if seconds is not None:
+            self.evaluation_times.append(seconds)
+
+    def to_dict(self) -> dict:
+        "Get a json serializable summary"
+
+        evaluate_time = self.phases.get("evaluate", 0.0)
+        data = {
+            "generation": self.generation,
+            "highscore": self.highscore,
+            "wall_time": self.wall_time,
+            "phases": self.phases,
+            "evaluations": self.evaluations,
+            "forward_passes": self.forward_passes,
+            "forward_passes_per_second": self.forward_passes / evaluate_time if evaluate_time else None,
+            "slowest": self.slowest,
+        }
+        if self.evaluation_times:
+            times = np.array(self.evaluation_times)
+            data["evaluation_time"] = {
+                "mean": float(times.mean()),
+                "p50": float(np.percentile(times, 50)),
+                "p95": float(np.percentile(times, 95)),
+                "max": float(times.max()),
+            }
+        return data
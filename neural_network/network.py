@@ -1,44 +1,105 @@
 "NeuralNetwork by rafaelurben"
 
+import base64
 import json
-import random
-from copy import deepcopy
+
+import numpy as np
 
 from . import ACFUNCS
-from .utils import randplusminus
+from .activation_functions import get_array_acfunc, get_mixed_array_acfunc
+from .compiled import CompiledNetwork
+from .quantized import QuantizedNetwork
+from .utils import get_rng, randplusminus_array
+
+
+# Supported parameter types - float16 is only used for storage, calculations use float32
+DTYPES = ("float64", "float32", "float16")
+
+# Pruned layers with at least SPARSE_MIN_WEIGHTS weights, of which at most
+# SPARSE_MAX_DENSITY are live, are processed as sparse matrices for batches of
+# at most SPARSE_MAX_BATCH_SIZE samples - otherwise the dense matrix product is
+# faster, even though it also multiplies the pruned weights
+SPARSE_MAX_DENSITY = 0.03
+SPARSE_MIN_WEIGHTS = 2**17
+SPARSE_MAX_BATCH_SIZE = 2
+
+
+def _new_array(shape, default: float = None, dtype="float64") -> np.ndarray:
+    "Create an array filled with ``default`` or with random values between -1 and 1"
+
+    if default:
+        return np.full(shape, default, dtype=dtype)
+    return randplusminus_array(shape).astype(dtype, copy=False)
+
+
+def pack_mask(mask: np.ndarray) -> str:
+    "Encode a mask (see NeuralNetwork.set_mask) as a short string, e.g. for file headers"
+
+    return base64.b64encode(np.packbits(mask)).decode("ascii")
+
+
+def _unpack_mask(data: str, count: int) -> np.ndarray:
+    "Decode a mask encoded by pack_mask"
+
+    return np.unpackbits(np.frombuffer(base64.b64decode(data), dtype=np.uint8), count=count).astype(bool)
+
+
+def _check_dtype(dtype) -> np.dtype:
+    "Make sure the parameter type is supported"
+
+    dtype = np.dtype(dtype)
+    if dtype.name not in DTYPES:
+        raise ValueError(f"Unsupported dtype: {dtype} (supported: {', '.join(DTYPES)})")
+    return dtype
 
 
 class NeuralNetwork():
     """A neural network"""
 
-    def __init__(self, sizes: list, *, default_weight: float = None, default_bias: float = None, default_acfunc: str = "relu"):
+    def __init__(self, sizes: list, *, default_weight: float = None, default_bias: float = None, default_acfunc: str = "relu", dtype="float64"):
         """
         The list ``sizes`` contains the number of neurons in the
         respective layers of the network. For example, if the list
         was [2, 3, 1] then it would be a three-layer network, with the
         first layer containing 2 neurons, the second layer 3 neurons,
         and the third layer 1 neuron.
+
+        All weights and biases are stored in one flat array ``params``
+        (see get_params). ``weights`` (one ``sizes[i] x sizes[i-1]`` matrix
+        per layer) and ``biases`` (one vector per layer) are views into it.
+
+        ``actfuncs`` contains one entry per layer: either the name of the
+        activation function of the whole layer, or a list with one
+        function (name) per neuron, which is slower. It can be changed in
+        place, e.g. ``actfuncs[0] = "sigmoid"`` or, after assigning a list
+        to the layer, ``actfuncs[0][1] = "relu"``.
+
+        ``dtype`` is the type of the stored parameters (see DTYPES):
+        "float64" (default), "float32" (half the memory, results differ by
+        about 1e-6 relative) or "float16" (a quarter of the memory, only for
+        storage: calculations are done in float32 - parameters are rounded
+        to about 3 significant digits, which changes results by about 1e-3
+        relative). Mutations are rounded to the type as well, so very small
+        learning rates have no effect with float16.
+
+        Weights can be removed with prune(): ``mask`` then marks the live
+        parameters, pruned weights stay 0 and big layers with few live
+        weights are processed as sparse matrices (see SPARSE_MAX_DENSITY).
         """
 
+        dtype = _check_dtype(dtype)
+
         self.sizes: list = sizes
-        self.biases: list[list] = [
-            [
-                default_bias or randplusminus() for _ in range(sizes[i])
-            ] for i in range(1, len(sizes))
-        ]
-        self.weights: list[list[list]] = [
-            [
-                [
-                    default_weight or randplusminus()
-                    for _ in range(sizes[i-1])
-                ] for _ in range(sizes[i])
-            ] for i in range(1, len(sizes))
-        ]
-        self.actfuncs: list[list] = [
-            [
-                default_acfunc for _ in range(sizes[i])
-            ] for i in range(1, len(sizes))
-        ]
+        # Number of samples processed so far (used for metrics)
+        self.forward_passes = 0
+
+        self._bind_params(np.empty(self.count_params(sizes), dtype=dtype))
+        for weights, biases in zip(self._weights, self._biases):
+            weights[...] = _new_array(weights.shape, default_weight, dtype)
+            biases[...] = _new_array(biases.shape, default_bias, dtype)
+        self._bind_mask(None)
+
+        self.actfuncs: list = [default_acfunc for _ in range(1, len(sizes))]
 
     def __call__(self, inputs: list):
         """
@@ -51,65 +112,362 @@ class NeuralNetwork():
     def add_layer(self, size, *, default_weight: float = None, default_bias: float = None, default_acfunc: str = "relu") -> None:
         "Add a layer"
 
+        params = np.concatenate([
+            self.params,
+            _new_array(size * self.sizes[-1], default_weight, self.dtype),
+            _new_array(size, default_bias, self.dtype),
+        ])
         self.sizes.append(size)
-        self.biases.append(
-            [
-                default_bias or randplusminus()
-                for _ in range(size)
-            ]
-        )
-        self.weights.append(
-            [
-                [
-                    default_weight or randplusminus()
-                    for _ in range(self.sizes[-2])
-                ] for _ in range(self.sizes[-1])
-            ]
-        )
-        self.actfuncs.append(
-            [
-                default_acfunc
-                for _ in range(size)
-            ]
-        )
+        self._bind_params(params)
+        if self.mask is not None:
+            # The connections of the new layer are all live
+            self._bind_mask(np.concatenate([self.mask, np.ones(params.shape[0] - self.mask.shape[0], dtype=bool)]))
+        self.actfuncs = self.actfuncs + [default_acfunc]
+
+    # Parameters
+
+    @staticmethod
+    def count_params(sizes: list) -> int:
+        "Get the number of parameters (weights and biases) of a network with the given sizes"
+
+        return sum((sizes[i-1] + 1) * sizes[i] for i in range(1, len(sizes)))
+
+    @staticmethod
+    def get_layer_slices(sizes: list) -> "list[tuple[slice, slice]]":
+        "Get the positions of the weights and biases of each layer in the flat parameter array"
+
+        slices = []
+        offset = 0
+        for i in range(1, len(sizes)):
+            count = sizes[i] * sizes[i-1]
+            slices.append((slice(offset, offset+count), slice(offset+count, offset+count+sizes[i])))
+            offset += count + sizes[i]
+        return slices
+
+    def _bind_params(self, params: np.ndarray) -> None:
+        "Use ``params`` as the storage of all parameters - weights and biases become views into it"
+
+        self.params: np.ndarray = params
+        self._weights = []
+        self._biases = []
+        offset = 0
+        for inputs, outputs in zip(self.sizes, self.sizes[1:]):
+            count = inputs * outputs
+            self._weights.append(params[offset:offset+count].reshape(outputs, inputs))
+            self._biases.append(params[offset+count:offset+count+outputs])
+            offset += count + outputs
+
+    @property
+    def weights(self) -> "list[np.ndarray]":
+        "Weight matrices (one ``sizes[i] x sizes[i-1]`` view into ``params`` per layer)"
+        return self._weights
+
+    @weights.setter
+    def weights(self, weights: list) -> None:
+        for view, values in zip(self._weights, weights):
+            view[...] = np.reshape(values, view.shape)
+        self._clear_pruned()
+
+    @property
+    def biases(self) -> "list[np.ndarray]":
+        "Bias vectors (one view into ``params`` per layer)"
+        return self._biases
+
+    @biases.setter
+    def biases(self, biases: list) -> None:
+        for view, values in zip(self._biases, biases):
+            view[...] = values
+
+    def get_params(self) -> np.ndarray:
+        "Get a copy of all parameters as one flat array (layer by layer: weights row by row, then biases)"
+
+        return self.params.copy()
+
+    def set_params(self, params: np.ndarray) -> None:
+        "Overwrite all parameters with the values of a flat array (see get_params)"
+
+        params = np.asarray(params)
+        if params.shape != self.params.shape:
+            raise ValueError(f"Invalid number of parameters: expected {self.params.shape}, got {params.shape}")
+        self.params[...] = params
+        self._clear_pruned()
+
+    # Pruning
+
+    @property
+    def density(self) -> float:
+        "Share of the weights which haven't been pruned (1.0 without pruning)"
+
+        if self.mask is None:
+            return 1.0
+        weightcount = self.params.shape[0] - sum(self.sizes[1:])
+        return (np.count_nonzero(self.mask) - sum(self.sizes[1:])) / weightcount if weightcount else 1.0
+
+    def set_mask(self, mask) -> None:
+        """
+        Set the live (True) and pruned (False) parameters
 
-    # Processing
+        ``mask`` is a flat boolean array in the layout of ``params``, or None
+        to make all weights live again. Biases are never pruned. Pruned
+        weights are set to 0 and stay 0: mutate() and set_params() don't
+        change them.
+        """
+
+        if mask is None:
+            self._bind_mask(None)
+            return
+
+        mask = np.array(mask, dtype=bool)
+        if mask.shape != self.params.shape:
+            raise ValueError(f"Invalid mask shape: expected {self.params.shape}, got {mask.shape}")
+        for _, biasslice in self.get_layer_slices(self.sizes):
+            mask[biasslice] = True
+
+        self._bind_mask(mask)
+        self._clear_pruned()
+
+    def prune(self, threshold: float = None, fraction: float = None) -> int:
+        """
+        Remove connections with small weights (magnitude pruning)
+
+        Prunes all live weights with a magnitude of at most ``threshold``,
+        or the ``fraction`` (between 0 and 1) of the live weights with the
+        smallest magnitude in every layer. Returns the number of weights
+        pruned by this call - ``mask`` is only set if it is greater than 0.
+        """
+
+        if (threshold is None) == (fraction is None):
+            raise ValueError("Either threshold or fraction must be given!")
+
+        live = np.ones(self.params.shape, dtype=bool) if self.mask is None else self.mask.copy()
+        magnitudes = np.abs(self.params)
+        before = np.count_nonzero(live)
+
+        for weightslice, _ in self.get_layer_slices(self.sizes):
+            layerlive = live[weightslice]
+            if threshold is not None:
+                layerlive &= magnitudes[weightslice] > threshold
+            else:
+                indexes = np.flatnonzero(layerlive)
+                count = int(len(indexes) * fraction)
+                if count:
+                    smallest = np.argpartition(magnitudes[weightslice][indexes], count-1)[:count]
+                    layerlive[indexes[smallest]] = False
+
+        pruned = before - np.count_nonzero(live)
+        # Without pruned weights, the network keeps having no mask (nothing to store or send)
+        if pruned:
+            self.set_mask(live)
+        return pruned
+
+    @property
+    def packed_mask(self) -> str:
+        "The mask encoded as a string (see pack_mask), or None without pruning"
+
+        return None if self.mask is None else pack_mask(self.mask)
+
+    def _bind_mask(self, mask: np.ndarray, sparse: list = None) -> None:
+        "Use ``mask`` (not copied, never changed in place) and build the sparse layers if not given"
+
+        self.mask: np.ndarray = mask
+        if mask is None:
+            self._sparse = None
+            return
+        mask.flags.writeable = False
+        self._sparse = sparse if sparse is not None else self._get_sparse_layers(mask)
+
+    def _get_sparse_layers(self, mask: np.ndarray) -> list:
+        """
+        Get the sparse representation of every layer with few live weights (None for dense layers)
+
+        CSR-like: the columns of the live weights row by row, the rows with
+        at least one live weight, where their weights start and the
+        positions of the weights in ``params`` - the values are read from
+        ``params`` in every forward pass, so mutations are always used.
+        """
+
+        layers = []
+        for (weightslice, _), inputs, outputs in zip(self.get_layer_slices(self.sizes), self.sizes, self.sizes[1:]):
+            layermask = mask[weightslice]
+            if layermask.size < SPARSE_MIN_WEIGHTS or np.count_nonzero(layermask) > SPARSE_MAX_DENSITY * layermask.size:
+                layers.append(None)
+                continue
+
+            rows, columns = np.nonzero(layermask.reshape(outputs, inputs))
+            starts = np.flatnonzero(np.diff(rows, prepend=-1))
+            positions = weightslice.start + rows * inputs + columns
+            layers.append((columns, rows[starts], starts, positions))
+        return layers
+
+    def _clear_pruned(self) -> None:
+        "Set the pruned weights to 0 (only writes if one isn't 0 yet)"
+
+        if self.mask is not None:
+            pruned = ~self.mask
+            if np.any(self.params[pruned]):
+                self.params[pruned] = 0
+
+    # Parameter type
+
+    @property
+    def dtype(self) -> np.dtype:
+        "Type of the stored parameters"
+        return self.params.dtype
+
+    @property
+    def compute_dtype(self) -> np.dtype:
+        "Type used for calculations (float32 for float16 networks)"
+        return np.result_type(self.dtype, np.float32)
+
+    def astype(self, dtype) -> "NeuralNetwork":
+        "Get a copy of the network with parameters of another type (see DTYPES)"
+
+        return self._from_params(self.sizes.copy(), self.params.astype(_check_dtype(dtype)), self._copy_actfuncs(),
+                                 self.mask, self._sparse)
+
+    # Activation functions
+
+    @property
+    def actfuncs(self) -> list:
+        "Activation functions (one name per layer, or a list with one per neuron)"
+        return self._actfuncs
+
+    @actfuncs.setter
+    def actfuncs(self, actfuncs: list) -> None:
+        self._actfuncs = actfuncs
+        self.resolve_actfuncs()
+
+    def resolve_actfuncs(self) -> None:
+        """
+        Look up the vectorized activation functions of all layers
+
+        Happens automatically when ``actfuncs`` is set, and before the next
+        forward pass or compile() after ``actfuncs`` has been changed in place.
+        """
+
+        # Compared with actfuncs by _update_kernels to notice changes in place
+        self._resolved_actfuncs = self._copy_actfuncs()
+        self._kernels = []
+        self._kernelnames = []
+
+        for acfuncs in self._actfuncs:
+            if isinstance(acfuncs, str) or not isinstance(acfuncs, list):
+                name = acfuncs
+            elif all(a == acfuncs[0] for a in acfuncs):
+                name = acfuncs[0]
+            else:
+                name = None
+
+            if name is None:
+                self._kernels.append(get_mixed_array_acfunc(acfuncs))
+            else:
+                self._kernels.append(get_array_acfunc(name))
+            self._kernelnames.append(name if isinstance(name, str) else None)
 
-    def _feed_forward_layer(self, inputs: list, layerindex: int) -> list:
-        "Process a layer"
+    def _update_kernels(self) -> None:
+        "Resolve the activation functions again if ``actfuncs`` has been changed in place"
 
-        currlaylen = self.sizes[layerindex]
-        lastlaylen = self.sizes[layerindex-1]
+        if self._actfuncs != self._resolved_actfuncs:
+            self.resolve_actfuncs()
+
+    # Processing
+
+    def _feed_forward_layer(self, inputs: np.ndarray, layerindex: int) -> np.ndarray:
+        "Process a layer (inputs: one row per sample)"
 
         if not 0 < layerindex < len(self.sizes):
             raise ValueError(
                 f"Invalid layer index! Must be greater than 0 and smaller than {len(self.sizes)}.")
-        if len(inputs) != lastlaylen:
+        if inputs.shape[1] != self.sizes[layerindex-1]:
             raise ValueError("Invalid number of inputs.")
 
-        result = [
-            (
-                self._get_actfunc(layerindex, i)(
-                    sum(
-                        [
-                            inputs[j] * self.weights[layerindex-1][i][j]
-                            for j in range(lastlaylen)
-                        ]
-                    ) + self.biases[layerindex-1][i]
-                )
-            )
-            for i in range(currlaylen)
-        ]
-        return result
+        sparse = self._sparse[layerindex-1] if self._sparse is not None else None
+        if sparse is None or inputs.shape[0] > SPARSE_MAX_BATCH_SIZE:
+            # float16 parameters are converted to float32 by numpy here
+            values = inputs @ self.weights[layerindex-1].T + self.biases[layerindex-1]
+        else:
+            values = self._feed_forward_sparse(inputs, layerindex, sparse)
+        return self._activate_layer(values, layerindex)
 
-    def feed_forward(self, inputs: list) -> list:
-        "Process the inputs through the network"
+    def _feed_forward_sparse(self, inputs: np.ndarray, layerindex: int, sparse: tuple) -> np.ndarray:
+        "Multiply the inputs with the live weights of a pruned layer (see _get_sparse_layers) and add the biases"
+
+        columns, rows, starts, positions = sparse
+        biases = self.biases[layerindex-1]
+
+        # One row per neuron (transposed), so the sums run over contiguous rows
+        values = np.zeros((self.sizes[layerindex], inputs.shape[0]), dtype=np.result_type(inputs, biases))
+        if len(positions):
+            products = np.take(inputs.T, columns, axis=0)
+            products *= np.take(self.params, positions)[:, np.newaxis]
+            values[rows] = np.add.reduceat(products, starts, axis=0)
+        return values.T + biases
+
+    def _activate_layer(self, values: np.ndarray, layerindex: int) -> np.ndarray:
+        "Apply the activation functions of a layer to its values (one row per sample)"
+
+        return self._kernels[layerindex-1](values)
+
+    def _get_layer_kernel(self, layerindex: int) -> "function":
+        """
+        Get the vectorized activation function of a layer, or None if
+        the neurons of the layer use different or custom functions
+        """
+
+        self._update_kernels()
+        if self._kernelnames[layerindex-1] is None:
+            return None
+        return self._kernels[layerindex-1]
+
+    def feed_forward_batch(self, inputs) -> np.ndarray:
+        """
+        Process many inputs through the network at once
+
+        ``inputs`` is a 2-D matrix (list of lists or numpy array) with one
+        row per sample. Returns a numpy array with one row of outputs per sample.
+        """
+
+        inputs = np.asarray(inputs, dtype=self.compute_dtype)
+        if inputs.ndim != 2:
+            raise ValueError("Inputs must be a 2-D matrix with one row per sample.")
+
+        self.forward_passes += inputs.shape[0]
+        self._update_kernels()
 
         for index in range(1, len(self.sizes)):
             inputs = self._feed_forward_layer(inputs, index)
 
         return inputs
 
+    def feed_forward(self, inputs: list) -> list:
+        "Process the inputs through the network"
+
+        return self.feed_forward_batch([inputs])[0].tolist()
+
+    def compile(self, dtype=np.float32, fuse: bool = True) -> CompiledNetwork:
+        """
+        Freeze the network into a CompiledNetwork for fast inference
+
+        See CompiledNetwork for details. Changes to this network afterwards
+        don't affect the compiled network.
+        """
+
+        return CompiledNetwork(self, dtype, fuse)
+
+    def quantize(self, per_row: bool = True, fuse: bool = True, calibration_inputs=None) -> QuantizedNetwork:
+        """
+        Quantize the network into a QuantizedNetwork (int8 weights) for inference
+
+        See QuantizedNetwork for details. If ``calibration_inputs`` (one row
+        per sample) are given, the error compared to this network is
+        measured on them and stored in the ``report`` of the result.
+        """
+
+        quantized = QuantizedNetwork(self, per_row, fuse)
+        if calibration_inputs is not None:
+            quantized.calibrate(self, calibration_inputs)
+        return quantized
+
     def _get_actfunc(self, layerindex: int, neuronindex: int) -> "function":
         "Get the activation function of a neuron"
 
@@ -120,7 +478,9 @@ class NeuralNetwork():
             raise ValueError(
                 f"Invalid neuron index! Must be greater than 0 and smaller than {self.sizes[layerindex]}.")
 
-        acfunc = self.actfuncs[layerindex-1][neuronindex]
+        acfunc = self.actfuncs[layerindex-1]
+        if isinstance(acfunc, list):
+            acfunc = acfunc[neuronindex]
 
         if isinstance(acfunc, str):
             if not acfunc in ACFUNCS:
@@ -131,30 +491,95 @@ class NeuralNetwork():
 
     # Adjusting
 
-    def mutate(self, learning_rate, mutation_chance: float = 0.01) -> None:
-        "Adjust the weights and biases randomly"
-        for layerindex in range(len(self.sizes)-1):
-            for neuronindex, _ in enumerate(self.biases[layerindex]):
-                if random.random() <= mutation_chance:
-                    self.biases[layerindex][neuronindex] += randplusminus(learning_rate)
-            for neuronindex, _ in enumerate(self.weights[layerindex]):
-                for nextneuronindex, _ in enumerate(self.weights[layerindex][neuronindex]):
-                    if random.random() <= mutation_chance:
-                        self.weights[layerindex][neuronindex][nextneuronindex] += randplusminus(learning_rate)
+    def mutate(self, learning_rate, mutation_chance: float = 0.01, rng: np.random.Generator = None,
+               prune_threshold: float = 0.0) -> None:
+        """
+        Adjust the weights and biases randomly
+
+        Every weight and bias is changed by a random value between
+        -learning_rate and learning_rate with a probability of ``mutation_chance``.
+        ``rng`` can be used to pass a seeded numpy generator (default: see utils.seed).
+        Pruned weights are not changed. If ``prune_threshold`` is greater
+        than 0, weights with a smaller magnitude are pruned afterwards (see prune).
+        """
+
+        rng = rng or get_rng()
+
+        mask = rng.random(self.params.shape) <= mutation_chance
+        if self.mask is not None:
+            mask &= self.mask
+        self.params[mask] += randplusminus_array(np.count_nonzero(mask), learning_rate, rng)
+
+        if prune_threshold > 0:
+            self.prune(threshold=prune_threshold)
 
     # Import & Export
 
     @classmethod
-    def from_dict(cls, data: dict) -> "NeuralNetwork":
-        "Import a network from a dictionary"
+    def from_params(cls, sizes: list, params: np.ndarray, actfuncs: list, mask=None) -> "NeuralNetwork":
+        """
+        Create a network from a flat parameter array (see get_params)
 
-        newnetwork = cls(data["sizes"])
-        newnetwork.biases = data["biases"]
-        newnetwork.weights = data["weights"]
-        newnetwork.actfuncs = data["actfuncs"]
+        ``params`` is used as the storage of the new network, not copied
+        (unless it isn't a contiguous numpy array), so it can e.g. be a
+        memory-mapped file or shared memory. ``mask`` optionally marks
+        the live parameters (see set_mask): a boolean array or a string
+        from pack_mask.
+        """
 
+        params = np.ascontiguousarray(params)
+        _check_dtype(params.dtype)
+        if params.shape != (cls.count_params(sizes),):
+            raise ValueError(f"Invalid number of parameters for sizes {sizes}: {params.shape}")
+
+        newnetwork = cls._from_params(list(sizes), params, actfuncs)
+        if isinstance(mask, str):
+            mask = _unpack_mask(mask, params.shape[0])
+        if mask is not None:
+            newnetwork.set_mask(mask)
+        return newnetwork
+
+    @classmethod
+    def _from_params(cls, sizes: list, params: np.ndarray, actfuncs: list,
+                     mask: np.ndarray = None, sparse: list = None) -> "NeuralNetwork":
+        "Create a network from a flat parameter array (and the mask and sparse layers of a network) without any checks"
+
+        # Skip __init__, which would generate random values first
+        newnetwork = cls.__new__(cls)
+        newnetwork.sizes = sizes
+        newnetwork.forward_passes = 0
+        newnetwork._bind_params(params)
+        newnetwork._bind_mask(mask, sparse)
+        newnetwork.actfuncs = actfuncs
         return newnetwork
 
+    @classmethod
+    def from_dict(cls, data: dict) -> "NeuralNetwork":
+        "Import a network from a dictionary"
+
+        sizes = data["sizes"]
+        dtype = _check_dtype(data.get("dtype", "float64"))
+        params = np.concatenate([
+            np.ravel(np.array(part, dtype=dtype))
+            for weights, biases in zip(data["weights"], data["biases"])
+            for part in (weights, biases)
+        ]) if len(sizes) > 1 else np.empty(0, dtype=dtype)
+
+        mask = None
+        if "masks" in data:
+            # Only weights can be pruned
+            mask = np.concatenate([
+                np.ravel(np.array(part, dtype=bool))
+                for masks, biases in zip(data["masks"], data["biases"])
+                for part in (masks, np.ones(len(biases), dtype=bool))
+            ])
+        # Layers whose neurons all use the same function are stored with one name internally
+        actfuncs = [
+            acfuncs[0] if isinstance(acfuncs, list) and acfuncs and all(a == acfuncs[0] for a in acfuncs) else acfuncs
+            for acfuncs in data["actfuncs"]
+        ]
+        return cls.from_params(sizes, params, actfuncs, mask)
+
     @classmethod
     def from_json(cls, jsondata: str) -> "NeuralNetwork":
         "Import the network from a json string"
@@ -174,10 +599,22 @@ class NeuralNetwork():
 
         data = {
             "sizes": self.sizes,
-            "biases": self.biases,
-            "weights": self.weights,
-            "actfuncs": self.actfuncs,
+            "biases": [b.tolist() for b in self.biases],
+            "weights": [w.tolist() for w in self.weights],
+            # One entry per neuron, as in older versions
+            "actfuncs": [
+                acfuncs.copy() if isinstance(acfuncs, list) else [acfuncs] * size
+                for acfuncs, size in zip(self.actfuncs, self.sizes[1:])
+            ],
         }
+        if self.dtype != np.float64:
+            data["dtype"] = self.dtype.name
+        if self.mask is not None:
+            # One 0/1 matrix per layer in the shape of the weights (1: live)
+            data["masks"] = [
+                self.mask[weightslice].reshape(weights.shape).astype(np.uint8).tolist()
+                for (weightslice, _), weights in zip(self.get_layer_slices(self.sizes), self.weights)
+            ]
         return data
 
     def to_json(self, indent: int = 4) -> str:
@@ -194,15 +631,18 @@ class NeuralNetwork():
     def clone(self) -> "NeuralNetwork":
         "Get a clone of the network"
 
-        newnetwork = self.__class__(self.sizes.copy())
-        newnetwork.biases = deepcopy(self.biases)
-        newnetwork.weights = deepcopy(self.weights)
-        newnetwork.actfuncs = deepcopy(self.actfuncs)
-        return newnetwork
+        return self._from_params(self.sizes.copy(), self.params.copy(), self._copy_actfuncs(), self.mask, self._sparse)
+
+    def _copy_actfuncs(self) -> list:
+        "Get a copy of the activation functions (for a new network)"
+
+        return [a.copy() if isinstance(a, list) else a for a in self.actfuncs]
 
-    def clone_and_mutate(self, learning_rate, mutation_chance: float = 0.01) -> "NeuralNetwork":
+    def clone_and_mutate(self, learning_rate, mutation_chance: float = 0.01, rng: np.random.Generator = None,
+                         prune_threshold: float = 0.0) -> "NeuralNetwork":
         "Get a clone of the network and mutate it"
 
         newnetwork = self.clone()
-        newnetwork.mutate(learning_rate=learning_rate, mutation_chance=mutation_chance)
+        newnetwork.mutate(learning_rate=learning_rate, mutation_chance=mutation_chance, rng=rng,
+                          prune_threshold=prune_threshold)
         return newnetwork
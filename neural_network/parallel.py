@@ -0,0 +1,425 @@
+"Parallel evaluation of genomes"
+
+import multiprocessing
+import multiprocessing.pool
+import time
+import typing
+import weakref
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .network import NeuralNetwork
+from .genome import Genome
+
+# Set up once per worker process by _init_worker
+_worker_options = {}
+
+
+def _network_state(network: NeuralNetwork) -> dict:
+    "Get the parameters of a network in a form which can be sent to a worker"
+
+    return {
+        "sizes": network.sizes,
+        "params": network.params,
+        "actfuncs": network.actfuncs,
+        "mask": network.mask,
+    }
+
+
+def _init_worker(genome_class, genome_setup_args, genome_setup_kwargs, reuse_genomes: bool) -> None:
+    "Store the genome options in the worker process"
+
+    _worker_options["genome_class"] = genome_class
+    _worker_options["genome_setup_args"] = genome_setup_args
+    _worker_options["genome_setup_kwargs"] = genome_setup_kwargs
+    _worker_options["reuse_genomes"] = reuse_genomes
+    # Genome of the last evaluation (reset for the next network if reuse_genomes is set)
+    _worker_options["genome"] = None
+
+
+def _init_shared_worker(genome_class, genome_setup_args, genome_setup_kwargs, reuse_genomes: bool,
+                        storeinfo: dict) -> None:
+    "Store the genome options in the worker process and attach to the shared population store"
+
+    _init_worker(genome_class, genome_setup_args, genome_setup_kwargs, reuse_genomes)
+
+    memories = [shared_memory.SharedMemory(name=name) for name in storeinfo["names"]]
+    buffers = []
+    for memory in memories:
+        buffer = np.ndarray(storeinfo["shape"], storeinfo["dtype"], buffer=memory.buf)
+        # Genomes only read their parameters
+        buffer.flags.writeable = False
+        buffers.append(buffer)
+
+    _worker_options["shared_memories"] = memories
+    _worker_options["shared_buffers"] = buffers
+    _worker_options["sizes"] = storeinfo["sizes"]
+    _worker_options["actfuncs"] = storeinfo["actfuncs"]
+
+
+def _run_in_worker(network: NeuralNetwork, generation: int) -> tuple:
+    """
+    Create a genome for a network (or reset the last one) and evaluate it
+
+    Returns the score, the evaluation time and the number of forward passes
+    """
+
+    genome = _worker_options["genome"]
+    if genome is not None and _worker_options["reuse_genomes"]:
+        genome.reset(network)
+    else:
+        genome = _worker_options["genome_class"](network)
+        genome.setup(*_worker_options["genome_setup_args"], **_worker_options["genome_setup_kwargs"])
+
+    # Not reused after a failed evaluation
+    _worker_options["genome"] = None
+    start = time.perf_counter()
+    genome.run_evaluation(generation)
+    seconds = time.perf_counter() - start
+    _worker_options["genome"] = genome
+    return genome.score, seconds, genome.network.forward_passes
+
+
+def _evaluate_in_worker(task: tuple) -> tuple:
+    "Rebuild a genome from its network parameters and evaluate it"
+
+    networkstate, generation = task
+    return _run_in_worker(NeuralNetwork.from_params(**networkstate), generation)
+
+
+def _evaluate_shared_in_worker(task: tuple) -> tuple:
+    "Evaluate a genome whose parameters are a row of the shared population store"
+
+    (buffer, row), actfuncs, mask, generation = task
+
+    params = _worker_options["shared_buffers"][buffer][row]
+    network = NeuralNetwork.from_params(_worker_options["sizes"], params, actfuncs or _worker_options["actfuncs"], mask)
+    return _run_in_worker(network, generation)
+
+
+class ProcessPoolEvaluator():
+    """
+    Evaluates genomes in a pool of worker processes
+
+    Only the network parameters are sent to the workers, where the genomes
+    are rebuilt with the genome class and setup arguments of the trainer,
+    so ``genome.obj`` does not have to be picklable. The genome class has
+    to be importable by the workers (i.e. not defined in ``__main__`` when
+    using the "spawn" start method). Only the scores are sent back. If the
+    trainer reuses genomes, every worker resets its last genome for the
+    next network instead of creating and setting up a new one.
+    """
+
+    _worker_initializer = staticmethod(_init_worker)
+    _worker_function = staticmethod(_evaluate_in_worker)
+
+    def __init__(self, workers: int = None, chunksize: int = 1, start_method: str = None):
+        self.workers = workers or multiprocessing.cpu_count()
+        self.chunksize = chunksize
+        self.start_method = start_method
+
+        self._pool = None
+        self._pool_options = None
+
+    def _get_worker_options(self, trainer) -> tuple:
+        "Get the arguments of the worker initializer"
+
+        return (trainer.genome_class, trainer.genome_setup_args, trainer.genome_setup_kwargs, trainer.reuse_genomes)
+
+    def _get_pool(self, trainer) -> multiprocessing.pool.Pool:
+        "Get the worker pool, (re)creating it if the worker options have changed"
+
+        options = self._get_worker_options(trainer)
+
+        if self._pool is None or self._pool_options != options:
+            self._close_pool()
+            context = multiprocessing.get_context(self.start_method)
+            self._pool = context.Pool(self.workers, initializer=self._worker_initializer, initargs=options)
+            self._pool_options = options
+
+        return self._pool
+
+    def _get_tasks(self, trainer, genomes: typing.List[Genome]) -> list:
+        "Get the tasks sent to the workers (one per genome)"
+
+        return [(_network_state(genome.network), trainer.generation) for genome in genomes]
+
+    def clone_network(self, trainer, network: NeuralNetwork) -> NeuralNetwork: # pylint: disable=unused-argument
+        "Copy a network for the next generation"
+
+        return network.clone()
+
+    def evaluate(self, trainer, genomes: typing.List[Genome]) -> None:
+        "Evaluate the genomes in the worker processes and store their scores"
+
+        # Imported here, so worker processes don't have to import tqdm
+        from tqdm import tqdm # pylint: disable=import-outside-toplevel
+
+        tasks = self._get_tasks(trainer, genomes)
+        pool = self._get_pool(trainer)
+
+        # imap returns the results in order, so the scores always end up on the right genome
+        results = pool.imap(self._worker_function, tasks, chunksize=self.chunksize)
+        try:
+            for index, result in enumerate(tqdm(results, total=len(tasks), desc=f"Generation {trainer.generation}")):
+                genome = genomes[index]
+                genome.score, genome.evaluation_time, forward_passes = result
+                trainer.metrics.add_evaluation(genome.evaluation_time, forward_passes)
+                trainer._report_progress(index + 1, len(tasks))
+        except BaseException:
+            # Interrupted or failed: don't wait for the remaining evaluations
+            self.terminate()
+            raise
+
+    def terminate(self) -> None:
+        "Stop the worker processes immediately, without waiting for running evaluations"
+
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+            self._pool_options = None
+
+    def _close_pool(self) -> None:
+        "Wait for the worker processes to finish and stop them"
+
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+            self._pool_options = None
+
+    def close(self) -> None:
+        "Shut down the worker processes"
+
+        self._close_pool()
+
+
+class SharedPopulationStore():
+    """
+    Parameters of a whole population in shared memory
+
+    Consists of two ``capacity x params`` blocks: the offspring of a
+    generation are written to one block while their parents are still being
+    read from the other. Networks stored here are views into a row of a
+    block (see NeuralNetwork.from_params), so worker processes can read
+    them without any copy.
+
+    Rows are reused every other generation. Networks which are still
+    referenced when their row is reused get a private copy of their
+    parameters first.
+    """
+
+    def __init__(self, sizes: list, dtype, capacity: int, actfuncs: list):
+        self.sizes: list = list(sizes)
+        self.dtype = np.dtype(dtype)
+        self.capacity: int = capacity
+        # Default activation functions (only different ones are sent to the workers)
+        self.actfuncs: list = actfuncs
+
+        shape = (capacity, NeuralNetwork.count_params(sizes))
+        nbytes = max(shape[0] * shape[1] * self.dtype.itemsize, 1)
+        self._memories = [shared_memory.SharedMemory(create=True, size=nbytes) for _ in range(2)]
+        self.buffers: typing.List[np.ndarray] = [
+            np.ndarray(shape, self.dtype, buffer=memory.buf) for memory in self._memories
+        ]
+        # Weak references to the networks using the rows
+        self._networks = [[None] * capacity for _ in range(2)]
+
+        # Block and number of rows used by the current generation
+        self._filling = 0
+        self._used = 0
+        # Set by evaluate: the next copy starts a new generation
+        self._sealed = True
+
+    def get_info(self) -> dict:
+        "Get everything a worker process needs to attach to the store"
+
+        return {
+            "names": [memory.name for memory in self._memories],
+            "shape": self.buffers[0].shape,
+            "dtype": self.dtype.str,
+            "sizes": self.sizes,
+            "actfuncs": self.actfuncs,
+        }
+
+    def is_compatible(self, network: NeuralNetwork) -> bool:
+        "Check whether a network can be stored here"
+
+        return network.sizes == self.sizes and network.dtype == self.dtype
+
+    def locate(self, network: NeuralNetwork) -> typing.Optional[typing.Tuple[int, int]]:
+        "Get the block and row of a network's parameters, or None if they aren't stored here"
+
+        if not self.is_compatible(network):
+            return None
+
+        address = network.params.__array_interface__["data"][0]
+        for index, buffer in enumerate(self.buffers):
+            offset = address - buffer.__array_interface__["data"][0]
+            if 0 <= offset < buffer.nbytes and offset % buffer.strides[0] == 0:
+                return index, offset // buffer.strides[0]
+        return None
+
+    @property
+    def free_rows(self) -> int:
+        "Number of rows left for the current generation"
+
+        return self.capacity - self._used
+
+    def _take_row(self, network: NeuralNetwork) -> typing.Tuple[int, int]:
+        "Reserve the next row for a network"
+
+        if self._sealed:
+            # First network of a new generation: use the block the parents aren't in
+            source = self.locate(network)
+            if source is not None:
+                self._filling = 1 - source[0]
+            self._used = 0
+            self._sealed = False
+
+        location = (self._filling, self._used)
+        self._used += 1
+
+        # Detach the network which used the row before (if it's still in use)
+        previous = self._networks[self._filling][location[1]]
+        previous = previous() if previous is not None else None
+        if previous is not None and previous is not network and self.locate(previous) == location:
+            previous._bind_params(previous.params.copy()) # pylint: disable=protected-access
+        return location
+
+    def clone_network(self, network: NeuralNetwork) -> typing.Optional[NeuralNetwork]:
+        "Copy a network into the next free row, or return None if the store is full"
+
+        if not self._sealed and self.free_rows < 1:
+            return None
+
+        buffer, row = self._take_row(network)
+        params = self.buffers[buffer][row]
+        params[...] = network.params
+
+        newnetwork = type(network)._from_params( # pylint: disable=protected-access
+            list(network.sizes), params, network._copy_actfuncs(), network.mask, network._sparse) # pylint: disable=protected-access
+        self._networks[buffer][row] = weakref.ref(newnetwork)
+        return newnetwork
+
+    def add_network(self, network: NeuralNetwork) -> typing.Tuple[int, int]:
+        "Move the parameters of a network into the next free row"
+
+        if self._sealed:
+            # No new generation: only append after the rows in use
+            location = (self._filling, self._used)
+            self._used += 1
+        else:
+            location = self._take_row(network)
+
+        params = self.buffers[location[0]][location[1]]
+        params[...] = network.params
+        network._bind_params(params) # pylint: disable=protected-access
+        self._networks[location[0]][location[1]] = weakref.ref(network)
+        return location
+
+    def seal(self) -> None:
+        "Mark the end of a generation (the next copy starts a new one)"
+
+        self._sealed = True
+
+    def close(self) -> None:
+        "Give all networks still in use a private copy of their parameters and free the shared memory"
+
+        for rows in self._networks:
+            for reference in rows:
+                network = reference() if reference is not None else None
+                if network is not None and self.locate(network) is not None:
+                    network._bind_params(network.params.copy()) # pylint: disable=protected-access
+
+        self.buffers = []
+        self._networks = [[], []]
+        for memory in self._memories:
+            try:
+                memory.close()
+            except BufferError:
+                # Still referenced somewhere - freed together with the last reference
+                pass
+            memory.unlink()
+        self._memories = []
+
+
+class SharedMemoryEvaluator(ProcessPoolEvaluator):
+    """
+    Evaluates genomes in a pool of worker processes using a SharedPopulationStore
+
+    The trainer copies offspring directly into the store (see clone_network),
+    so only the location of each genome is sent to the workers and only the
+    scores are sent back. The same requirements as for ProcessPoolEvaluator
+    apply; additionally all networks must have the same sizes.
+    """
+
+    _worker_initializer = staticmethod(_init_shared_worker)
+    _worker_function = staticmethod(_evaluate_shared_in_worker)
+
+    def __init__(self, workers: int = None, chunksize: int = 1, start_method: str = None):
+        super().__init__(workers, chunksize, start_method)
+        self.store: SharedPopulationStore = None
+
+    def _get_worker_options(self, trainer) -> tuple:
+        return super()._get_worker_options(trainer) + (self.store.get_info(),)
+
+    def _create_store(self, network: NeuralNetwork, capacity: int) -> None:
+        "Replace the store by a new one for networks like ``network``"
+
+        self._close_store()
+        self.store = SharedPopulationStore(network.sizes, network.dtype, capacity, network.actfuncs)
+
+    def clone_network(self, trainer, network: NeuralNetwork) -> NeuralNetwork:
+        "Copy a network for the next generation - directly into the store if possible"
+
+        if self.store is None:
+            self._create_store(network, trainer.population_size)
+
+        newnetwork = None
+        if self.store.is_compatible(network):
+            newnetwork = self.store.clone_network(network)
+        # Not stored (yet): moved into the store by evaluate
+        return newnetwork if newnetwork is not None else network.clone()
+
+    def _get_tasks(self, trainer, genomes: typing.List[Genome]) -> list:
+        networks = [genome.network for genome in genomes]
+        if not networks:
+            return []
+        if any(network.sizes != networks[0].sizes or network.dtype != networks[0].dtype for network in networks):
+            raise ValueError("All networks must have the same sizes and parameter type!")
+
+        locations = None
+        if self.store is not None and all(self.store.is_compatible(network) for network in networks):
+            locations = [self.store.locate(network) for network in networks]
+            if locations.count(None) > self.store.free_rows:
+                locations = None
+        if locations is None:
+            # New, different or too many networks
+            self._create_store(networks[0], max(trainer.population_size, len(networks)))
+            locations = [None] * len(networks)
+
+        for index, network in enumerate(networks):
+            if locations[index] is None:
+                locations[index] = self.store.add_network(network)
+        self.store.seal()
+
+        return [
+            (location, None if network.actfuncs == self.store.actfuncs else network.actfuncs,
+             network.packed_mask, trainer.generation)
+            for location, network in zip(locations, networks)
+        ]
+
+    def _close_store(self) -> None:
+        "Stop the workers (which use the store) and free the store"
+
+        if self.store is not None:
+            self._close_pool()
+            self.store.close()
+            self.store = None
+
+    def close(self) -> None:
+        super().close()
+        self._close_store()
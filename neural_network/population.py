@@ -0,0 +1,115 @@
+"Population-wide evaluation"
+
+import typing
+
+import numpy as np
+
+from .network import NeuralNetwork
+
+
+class PopulationEngine():
+    """
+    Evaluates all networks of a population at once
+
+    The weights of all networks are stacked into one
+    ``population x sizes[i] x sizes[i-1]`` tensor per layer, so a layer of
+    the whole population is processed with one batched matrix product.
+    All networks must have the same sizes.
+    """
+
+    def __init__(self, networks: typing.List[NeuralNetwork]):
+        if not networks:
+            raise ValueError("At least one network is required!")
+
+        sizes = networks[0].sizes
+        if any(network.sizes != sizes for network in networks):
+            raise ValueError("All networks must have the same sizes!")
+
+        self.sizes: list = list(sizes)
+        self.networks = networks
+        self.dtype = np.result_type(*(network.compute_dtype for network in networks))
+        # Number of network evaluations so far (used for metrics)
+        self.forward_passes = 0
+        # Stack the flat parameter arrays once and slice per-layer views out of it
+        self.params: np.ndarray = np.stack([network.params for network in networks]).astype(self.dtype, copy=False)
+        self.weights: typing.List[np.ndarray] = []
+        self.biases: typing.List[np.ndarray] = []
+        for i, (weightslice, biasslice) in enumerate(NeuralNetwork.get_layer_slices(sizes), 1):
+            self.weights.append(self.params[:, weightslice].reshape(len(networks), sizes[i], sizes[i-1]))
+            self.biases.append(self.params[:, biasslice])
+
+        # One shared kernel per layer if all networks use the same activation
+        # function for the whole layer, otherwise None (per-network fallback)
+        self._kernels = []
+        for layerindex in range(1, len(sizes)):
+            kernels = {network._get_layer_kernel(layerindex) for network in networks}
+            self._kernels.append(kernels.pop() if len(kernels) == 1 else None)
+
+        # (indexes, weights, biases) of the networks selected by the last feed_forward call
+        self._selection = None
+
+    def __len__(self):
+        return len(self.networks)
+
+    def feed_forward(self, inputs, indexes: typing.List[int] = None) -> np.ndarray:
+        """
+        Process one input row per network through all networks at once
+
+        ``inputs`` is a 2-D matrix with one row per network (or a single row
+        which is used for every network). If ``indexes`` is given, only the
+        networks at these positions are processed and ``inputs`` has one row
+        per index. Returns a numpy array with one row of outputs per network.
+
+        The parameters of the selected networks are copied once and reused
+        while the following calls select the same ones, so pass None (not
+        all positions) while all networks are processed.
+        """
+
+        count = len(self.networks) if indexes is None else len(indexes)
+
+        inputs = np.asarray(inputs, dtype=self.dtype)
+        if inputs.ndim == 1:
+            inputs = np.broadcast_to(inputs, (count, inputs.shape[0]))
+        if inputs.shape != (count, self.sizes[0]):
+            raise ValueError(
+                f"Invalid inputs! Expected shape {(count, self.sizes[0])}, got {inputs.shape}.")
+
+        self.forward_passes += count
+
+        allweights, allbiases = self._select(indexes)
+        for layerindex in range(1, len(self.sizes)):
+            weights = allweights[layerindex-1]
+            biases = allbiases[layerindex-1]
+
+            values = np.matmul(weights, inputs[:, :, np.newaxis])[:, :, 0] + biases
+            inputs = self._activate_layer(values, layerindex, indexes)
+
+        return inputs
+
+    def _select(self, indexes: typing.List[int] = None) -> typing.Tuple[list, list]:
+        "Get the weights and biases of the networks at the given positions (copied only if the selection changed)"
+
+        if indexes is None:
+            return self.weights, self.biases
+
+        if self._selection is None or self._selection[0] != list(indexes):
+            rows = np.asarray(indexes, dtype=np.intp)
+            self._selection = (
+                list(indexes),
+                [weights[rows] for weights in self.weights],
+                [biases[rows] for biases in self.biases],
+            )
+        return self._selection[1], self._selection[2]
+
+    def _activate_layer(self, values: np.ndarray, layerindex: int, indexes: typing.List[int] = None) -> np.ndarray:
+        "Apply the activation functions of a layer (one row per network)"
+
+        kernel = self._kernels[layerindex-1]
+        if kernel is not None:
+            return kernel(values)
+
+        if indexes is None:
+            indexes = range(len(self.networks))
+        for row, index in enumerate(indexes):
+            values[row:row+1] = self.networks[index]._activate_layer(values[row:row+1], layerindex)
+        return values
@@ -0,0 +1,141 @@
+"Quantized networks for memory-efficient inference"
+
+import numpy as np
+
+from .compiled import CompiledNetwork
+
+# Largest absolute value of a quantized weight or input
+QMAX = 127
+
+
+def _quantize_symmetric(values: np.ndarray, scale: np.ndarray) -> np.ndarray:
+    "Round values / scale to int8 (scale must not be 0)"
+
+    return np.clip(np.rint(values / scale), -QMAX, QMAX).astype(np.int8)
+
+
+class QuantizedNetwork():
+    """
+    Int8 inference plan of a NeuralNetwork (see NeuralNetwork.quantize)
+
+    Post-training quantization: the weights of every layer are stored as
+    int8 with one float scale per output neuron (``per_row``) or per layer,
+    the biases as float32. At inference, the inputs of every layer are
+    quantized to int8 dynamically (one scale per sample), multiplied with
+    the int8 weights with exact integer accumulation and scaled back.
+    Identity layers are fused into the next layer first (as in
+    CompiledNetwork) if ``fuse`` is True.
+
+    The integer products are summed in float32 when that is exact
+    (``inputs * 127**2 < 2**24``), otherwise in float64, so the result is
+    the same as with int32 accumulation, but uses the BLAS matrix product.
+    The int8 weights take 4 times less memory than float32 and 8 times less
+    than float64. They are converted to the accumulation type (a full float
+    copy of the layer) one layer at a time in every call, so inference is
+    usually slower than with a CompiledNetwork - use this to save memory,
+    not time.
+
+    Use calibrate() to measure the error compared to the float network.
+    The quantized network doesn't keep a reference to the float network.
+    """
+
+    def __init__(self, network, per_row: bool = True, fuse: bool = True):
+        self.per_row = per_row
+        self.sizes = [network.sizes[0]]
+        # Results of the last calibrate() call
+        self.report: dict = None
+
+        # Fused float64 layers (weights transposed: inputs x outputs), only used here
+        reference = CompiledNetwork(network, np.float64, fuse)
+
+        self._layers = []
+        for weights, biases, inplace in reference._layers: # pylint: disable=protected-access
+            if per_row:
+                maximum = np.max(np.abs(weights), axis=0)
+            else:
+                maximum = np.full(weights.shape[1], np.max(np.abs(weights), initial=0))
+            scales = np.where(maximum > 0, maximum / QMAX, 1).astype(np.float32)
+
+            qweights = _quantize_symmetric(weights, scales)
+            qweights.flags.writeable = False
+            scales.flags.writeable = False
+            biases = biases.astype(np.float32)
+            biases.flags.writeable = False
+
+            # Exact in float32 up to 2**24
+            accumulate = np.float32 if weights.shape[0] * QMAX**2 < 2**24 else np.float64
+
+            self._layers.append((qweights, scales, biases, inplace, accumulate))
+            self.sizes.append(weights.shape[1])
+
+    @property
+    def nbytes(self) -> int:
+        "Memory used by the parameters in bytes"
+
+        return sum(w.nbytes + s.nbytes + b.nbytes for w, s, b, _, _ in self._layers)
+
+    def __call__(self, inputs: list) -> list:
+        return self.feed_forward(inputs)
+
+    def feed_forward_batch(self, inputs) -> np.ndarray:
+        "Process many inputs (one row per sample) - returns an array with one row of outputs per sample"
+
+        values = np.asarray(inputs, dtype=np.float32)
+        if values.ndim != 2 or values.shape[1] != self.sizes[0]:
+            raise ValueError(f"Inputs must be a 2-D matrix with {self.sizes[0]} columns.")
+
+        for qweights, scales, biases, inplace, accumulate in self._layers:
+            # Dynamic quantization of the inputs: one scale per sample
+            maximum = np.max(np.abs(values), axis=1, keepdims=True)
+            inputscales = np.where(maximum > 0, maximum / QMAX, 1).astype(np.float32)
+            qinputs = np.clip(np.rint(values / inputscales), -QMAX, QMAX).astype(accumulate)
+
+            # Integer products, summed exactly
+            products = qinputs @ qweights.astype(accumulate)
+
+            products *= inputscales
+            products *= scales
+            values = products.astype(np.float32, copy=False)
+            values += biases
+            inplace(values)
+
+        return values
+
+    def feed_forward(self, inputs: list) -> list:
+        "Process the inputs through the network"
+
+        return self.feed_forward_batch([inputs])[0].tolist()
+
+    def calibrate(self, network, inputs) -> dict:
+        """
+        Compare the outputs with the ones of the float ``network`` (the one
+        which has been quantized) on a set of inputs (one row per sample)
+        - returns and stores the report
+
+        The report contains the maximum and mean absolute error, the error
+        relative to the range of the float outputs, the share of samples
+        with the same largest output (for classifiers) and the memory used
+        compared to float32 parameters (of the same, fused layers).
+        """
+
+        inputs = np.asarray(inputs, dtype=np.float64)
+        if network.sizes[0] != self.sizes[0] or network.sizes[-1] != self.sizes[-1]:
+            raise ValueError("The network doesn't match the quantized network!")
+
+        forward_passes = network.forward_passes
+        expected = np.asarray(network.feed_forward_batch(inputs), dtype=np.float64)
+        network.forward_passes = forward_passes
+        actual = self.feed_forward_batch(inputs).astype(np.float64)
+        error = np.abs(actual - expected)
+        outputrange = float(np.max(expected) - np.min(expected)) or 1.0
+
+        self.report = {
+            "samples": len(inputs),
+            "max_abs_error": float(np.max(error)),
+            "mean_abs_error": float(np.mean(error)),
+            "max_relative_error": float(np.max(error)) / outputrange,
+            "argmax_agreement": float(np.mean(np.argmax(actual, axis=1) == np.argmax(expected, axis=1))),
+            "nbytes": self.nbytes,
+            "nbytes_float32": sum(weights.size + biases.size for weights, _, biases, _, _ in self._layers) * 4,
+        }
+        return self.report
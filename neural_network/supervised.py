@@ -0,0 +1,330 @@
+"Supervised training"
+
+import typing
+
+import numpy as np
+from tqdm import tqdm
+
+from .network import NeuralNetwork
+from .manager import NeuralManager
+from .activation_functions import get_array_acfunc_derivative, get_mixed_array_acfunc
+
+OPTIMIZERS = ("sgd", "adam")
+LOSSES = ("mse", "binary_cross_entropy")
+
+
+def iterate_batches(inputs, targets, batch_size: int = 32, shuffle: bool = True, rng: np.random.Generator = None) -> typing.Iterator[tuple]:
+    """
+    Split inputs and targets (one row per sample) into mini-batches
+
+    Works with any arrays supporting indexing, e.g. memory-mapped files.
+    For datasets which don't fit into memory at all, write a generator
+    yielding ``(inputs, targets)`` batches instead.
+    """
+
+    count = len(inputs)
+    if len(targets) != count:
+        raise ValueError("Inputs and targets must have the same number of samples!")
+
+    if shuffle:
+        order = (rng or np.random.default_rng()).permutation(count)
+        for start in range(0, count, batch_size):
+            indexes = np.sort(order[start:start+batch_size])
+            yield inputs[indexes], targets[indexes]
+    else:
+        for start in range(0, count, batch_size):
+            yield inputs[start:start+batch_size], targets[start:start+batch_size]
+
+
+class SupervisedTrainer(NeuralManager):
+    """
+    Neural network training with backpropagation and mini-batch gradient descent
+
+    Trains a single NeuralNetwork on labelled data. Batches are
+    ``(inputs, targets)`` pairs of 2-D arrays (one row per sample), coming
+    from any iterable - e.g. iterate_batches or a generator reading them
+    from disk. Every pass over the data (train_epoch) counts as one
+    generation for saving and loading.
+
+    The gradient is computed as one flat array in the layout of
+    ``network.params``, so the optimizers update all parameters at once.
+    """
+
+    EDITABLE_FIELDS = [
+        'learning_rate', 'optimizer', 'momentum', 'beta1', 'beta2',
+        'epsilon', 'loss', 'checkpoint_interval']
+
+    def __init__(self, network: NeuralNetwork = None, name="neuro", folder="../data/"):
+        # Step size of the optimizer
+        self.learning_rate = 0.001
+
+        # Optimizer: "sgd" (with optional momentum) or "adam"
+        self.optimizer = "adam"
+        self.momentum = 0.0
+        self.beta1 = 0.9
+        self.beta2 = 0.999
+        self.epsilon = 1e-8
+
+        # Loss function: "mse" (mean squared error) or "binary_cross_entropy"
+        # (for outputs between 0 and 1, e.g. sigmoid)
+        self.loss = "mse"
+
+        # Format used by save_to_file: "json" or "binary" (compact, can be memory-mapped)
+        self.save_format = "json"
+        # Save automatically after every _ epochs (0: never)
+        self.checkpoint_interval = 0
+
+        self.network: NeuralNetwork = network
+        # Optimizer state: number of steps and one array per moment
+        self.step = 0
+        self.moments: typing.List[np.ndarray] = []
+        self._derivatives = None
+
+        super().__init__(name, folder)
+
+    @classmethod
+    def from_evolution(cls, trainer, name: str = None, folder: str = None) -> "SupervisedTrainer":
+        """
+        Create a trainer fine-tuning (a copy of) the best genome of a NeuroEvolution
+
+        Uses ``"{name}-finetuned"`` as the default name, so the saves don't
+        mix with the ones of the evolution.
+        """
+
+        if not trainer.genomes:
+            raise ValueError("The NeuroEvolution has no genomes!")
+
+        return cls(
+            trainer.genomes[0].network.clone(),
+            name=name or f"{trainer.name}-finetuned",
+            folder=folder or trainer.folder,
+        )
+
+    # Setup
+
+    def setup_from_file(self, filename: str = None) -> None:
+        "SETUP: Load the network and the optimizer state from a file"
+
+        data = self._load_data_from_file(filename)
+        optimizer = data["optimizer"]
+
+        if "params" in data:
+            # Binary format: first row are the parameters, the others the moments
+            rows = np.array(data["params"])
+            self.network = NeuralNetwork.from_params(data["sizes"], rows[0], data["actfuncs"], data.get("mask"))
+            self.moments = [moment.astype(self.network.compute_dtype) for moment in rows[1:]]
+        else:
+            self.network = NeuralNetwork.from_dict(data["network"])
+            self.moments = [np.array(moment, dtype=self.network.compute_dtype) for moment in optimizer["moments"]]
+
+        self.optimizer = optimizer["name"]
+        self.step = optimizer["step"]
+        self._derivatives = None
+
+    def setup_auto(self) -> None:
+        "SETUP: Load the network from a file, if it exists, otherwise train the given network"
+
+        try:
+            self.setup_from_file()
+        except FileNotFoundError:
+            if self.network is None:
+                raise
+
+    def save_to_file(self, filename: str = None) -> None:
+        "Save the network and the optimizer state to a file (used to resume training later)"
+
+        network = self.network
+        optimizer = {"name": self.optimizer, "step": self.step}
+
+        if self.save_format == "binary":
+            data = {
+                "generation": self.generation,
+                "sizes": network.sizes,
+                "actfuncs": network.actfuncs,
+                "optimizer": optimizer,
+            }
+            if network.mask is not None:
+                data["mask"] = network.packed_mask
+            rows = np.stack([network.params, *[m.astype(network.dtype, copy=False) for m in self.moments]])
+            self._save_binary_state_to_file(data, rows, filename)
+        else:
+            data = {
+                "generation": self.generation,
+                "network": network.to_dict(),
+                "optimizer": {**optimizer, "moments": [moment.tolist() for moment in self.moments]},
+            }
+            self._save_state_to_file(data, filename)
+
+    def export_network_to_file(self, filename: str = None, binary: bool = False) -> None:
+        "Export the network to a file (used to evaluate the network later, see NeuroLoader)"
+
+        return self._export_network_to_file(self.network, filename, binary)
+
+    # Backpropagation
+
+    def _get_derivatives(self) -> list:
+        "Get the vectorized derivatives of the activation functions of all layers"
+
+        if self._derivatives is None or self._derivatives[0] != self.network.actfuncs:
+            self.network._update_kernels() # pylint: disable=protected-access
+            derivatives = []
+            for acfuncs in self.network.actfuncs:
+                if isinstance(acfuncs, list) and any(a != acfuncs[0] for a in acfuncs):
+                    derivatives.append(get_mixed_array_acfunc(acfuncs, get_array_acfunc_derivative))
+                else:
+                    acfunc = acfuncs[0] if isinstance(acfuncs, list) else acfuncs
+                    derivatives.append(get_array_acfunc_derivative(acfunc))
+            self._derivatives = (self.network._copy_actfuncs(), derivatives) # pylint: disable=protected-access
+        return self._derivatives[1]
+
+    def _get_loss(self, outputs: np.ndarray, targets: np.ndarray) -> typing.Tuple[float, np.ndarray]:
+        "Get the loss and its gradient with respect to the outputs"
+
+        if self.loss == "mse":
+            difference = outputs - targets
+            return float(np.mean(difference**2)), 2 * difference / difference.size
+        if self.loss == "binary_cross_entropy":
+            outputs = np.clip(outputs, 1e-7, 1 - 1e-7)
+            loss = -np.mean(targets * np.log(outputs) + (1 - targets) * np.log(1 - outputs))
+            return float(loss), (outputs - targets) / (outputs * (1 - outputs)) / outputs.size
+        raise ValueError(f"Invalid loss function: {self.loss} (must be one of {LOSSES})")
+
+    def _prepare_batch(self, inputs, targets) -> typing.Tuple[np.ndarray, np.ndarray]:
+        "Convert a batch to 2-D arrays of the compute type"
+
+        dtype = self.network.compute_dtype
+        inputs = np.asarray(inputs, dtype=dtype)
+        targets = np.asarray(targets, dtype=dtype)
+        if inputs.ndim != 2 or targets.ndim != 2:
+            raise ValueError("Inputs and targets must be 2-D matrices with one row per sample.")
+        if len(inputs) != len(targets):
+            raise ValueError("Inputs and targets must have the same number of samples!")
+        return inputs, targets
+
+    def compute_gradient(self, inputs, targets) -> typing.Tuple[float, np.ndarray]:
+        """
+        Get the loss of a batch and its gradient with respect to all parameters
+
+        The gradient is a flat array in the layout of ``network.params``.
+        """
+
+        network = self.network
+        inputs, targets = self._prepare_batch(inputs, targets)
+        network.forward_passes += inputs.shape[0]
+        # Also resolves the activation functions again if they have been changed in place
+        derivatives = self._get_derivatives()
+
+        # Forward pass, keeping the values before and after the activation of every layer
+        activations = [inputs]
+        values = []
+        for layerindex in range(1, len(network.sizes)):
+            value = activations[-1] @ network.weights[layerindex-1].T + network.biases[layerindex-1]
+            values.append(value)
+            activations.append(network._activate_layer(value, layerindex)) # pylint: disable=protected-access
+
+        loss, delta = self._get_loss(activations[-1], targets)
+
+        # Backward pass
+        gradient = np.empty(network.params.shape, dtype=delta.dtype)
+        slices = network.get_layer_slices(network.sizes)
+        for layerindex in range(len(network.sizes)-1, 0, -1):
+            delta = delta * derivatives[layerindex-1](values[layerindex-1])
+            weightslice, biasslice = slices[layerindex-1]
+            gradient[weightslice] = (delta.T @ activations[layerindex-1]).ravel()
+            gradient[biasslice] = delta.sum(axis=0)
+            if layerindex > 1:
+                delta = delta @ network.weights[layerindex-1]
+
+        return loss, gradient
+
+    def _apply_gradient(self, gradient: np.ndarray) -> None:
+        "Update the parameters with the selected optimizer"
+
+        params = self.network.params
+        self.step += 1
+
+        if self.network.mask is not None:
+            # Pruned weights stay 0 (also with moments from before pruning)
+            pruned = ~self.network.mask
+            gradient[pruned] = 0
+            for moment in self.moments:
+                moment[pruned] = 0
+
+        if self.optimizer == "sgd":
+            if not self.momentum:
+                params -= (self.learning_rate * gradient).astype(params.dtype, copy=False)
+                return
+            if len(self.moments) != 1:
+                self.moments = [np.zeros_like(gradient)]
+            velocity = self.moments[0]
+            velocity *= self.momentum
+            velocity -= self.learning_rate * gradient
+            params += velocity.astype(params.dtype, copy=False)
+        elif self.optimizer == "adam":
+            if len(self.moments) != 2:
+                self.moments = [np.zeros_like(gradient), np.zeros_like(gradient)]
+            mean, variance = self.moments
+            mean *= self.beta1
+            mean += (1 - self.beta1) * gradient
+            variance *= self.beta2
+            variance += (1 - self.beta2) * gradient**2
+            # Bias correction of the moments (they start at 0)
+            stepsize = self.learning_rate * np.sqrt(1 - self.beta2**self.step) / (1 - self.beta1**self.step)
+            params -= (stepsize * mean / (np.sqrt(variance) + self.epsilon)).astype(params.dtype, copy=False)
+        else:
+            raise ValueError(f"Invalid optimizer: {self.optimizer} (must be one of {OPTIMIZERS})")
+
+    # Training
+
+    def train_batch(self, inputs, targets) -> float:
+        "Do one optimizer step on a batch and return its loss (before the step)"
+
+        loss, gradient = self.compute_gradient(inputs, targets)
+        self._apply_gradient(gradient)
+        return loss
+
+    def train_epoch(self, batches: typing.Iterable[tuple]) -> float:
+        "Train on all batches once and return the mean loss (weighted by batch size)"
+
+        self.generation += 1
+
+        total, count = 0.0, 0
+        for inputs, targets in tqdm(batches, desc=f"Epoch {self.generation}", unit="batch"):
+            loss = self.train_batch(inputs, targets)
+            total += loss * len(inputs)
+            count += len(inputs)
+
+        if not count:
+            raise ValueError("No batches to train on!")
+        loss = total / count
+
+        if self.checkpoint_interval and self.generation % self.checkpoint_interval == 0:
+            self.save_to_file()
+
+        print(f"Epoch {self.generation} ended! Loss: {loss}")
+        return loss
+
+    def train(self, get_batches: typing.Callable[[], typing.Iterable[tuple]], epochs: int = 1) -> typing.List[float]:
+        """
+        Train for several epochs and return the loss of each
+
+        ``get_batches`` is called at the start of every epoch and has to
+        return the batches, e.g. a generator function or
+        ``lambda: iterate_batches(inputs, targets)``.
+        """
+
+        return [self.train_epoch(get_batches()) for _ in range(epochs)]
+
+    def evaluate(self, batches: typing.Iterable[tuple]) -> float:
+        "Get the mean loss over all batches without training"
+
+        total, count = 0.0, 0
+        for inputs, targets in batches:
+            inputs, targets = self._prepare_batch(inputs, targets)
+            loss, _ = self._get_loss(self.network.feed_forward_batch(inputs), targets)
+            total += loss * len(inputs)
+            count += len(inputs)
+
+        if not count:
+            raise ValueError("No batches to evaluate!")
+        return total / count
@@ -1,12 +1,31 @@
 "Training"
 
+import cProfile
+import json
+import math
 import random
+import threading
+import time
 import typing
+from copy import deepcopy
+
+import numpy as np
 from tqdm import tqdm
 
-from .network import NeuralNetwork
+from .network import NeuralNetwork, pack_mask
 from .manager import NeuralManager
 from .genome import Genome
+from .population import PopulationEngine
+from .parallel import ProcessPoolEvaluator, SharedMemoryEvaluator
+from .distributed import DistributedEvaluator, DEFAULT_PORT
+from .checkpoint import CheckpointWriter
+from .fitnesscache import FitnessCache
+from .metrics import GenerationMetrics
+
+
+class GenerationInterrupted(Exception):
+    "Raised by run_generation if it has been interrupted (see NeuroEvolution.request_interrupt)"
+
 
 class NeuroEvolution(NeuralManager):
     "Neural network training using the neuro evolution technique"
@@ -14,7 +33,8 @@ class NeuroEvolution(NeuralManager):
     EDITABLE_FIELDS = [
         'learning_rate_base', 'learning_rate_factor', 'mutation_chance',
         'population_size', 'repop_amount_keep', 'repop_amount_random_add',
-        'repop_amount_random_mutate', 'repop_best_n']
+        'repop_amount_random_mutate', 'repop_best_n', 'halving_rounds',
+        'halving_keep_fraction', 'prune_threshold', 'checkpoint_interval']
 
     def __init__(self, genome_class, *genome_setup_args, name="neuro", folder="../data/", **genome_setup_kwargs):
         self.learning_rate_base = 0.01
@@ -22,6 +42,8 @@ class NeuroEvolution(NeuralManager):
 
         # Chance of mutating a bias or weight
         self.mutation_chance = 0.05
+        # Prune weights with a magnitude of at most _ after mutating them (0: never, see NeuralNetwork.prune)
+        self.prune_threshold = 0.0
 
         # Total size of a population
         self.population_size = 100
@@ -36,6 +58,39 @@ class NeuroEvolution(NeuralManager):
         # 4: The rest of the population will be mutations of the top _ genomes.
         self.repop_best_n = 5
 
+        # Successive halving (only for genomes with BUDGET = True, evaluated in this process):
+        # evaluate the genomes in _ rounds with increasing budget (a fraction of the full
+        # evaluation) and only keep the best fraction of them for the next round. The
+        # kept genomes (repop_amount_keep) always survive and at least repop_best_n
+        # genomes get a full evaluation. 0: always evaluate all genomes fully.
+        self.halving_rounds = 0
+        self.halving_keep_fraction = 0.5
+
+        # Reuse the genomes (and their environments) of older generations for new networks
+        # instead of creating and setting up new ones (see Genome.reset)
+        self.reuse_genomes = False
+
+        # Type of the network parameters: "float64", "float32" or "float16" (storage only)
+        # - see NeuralNetwork for the numeric tolerance of each type. None: the type of
+        # the loaded population (setup_from_file), float64 for a new one
+        self.dtype = None
+
+        # Format used by save_to_file: "json" or "binary" (compact, can be memory-mapped)
+        self.save_format = "json"
+        # Save automatically after every _ generations (0: never)
+        self.checkpoint_interval = 0
+
+        # Metrics: functions called with the GenerationMetrics after every generation,
+        # whether to append them to "neuro-{name}-metrics.jsonl" in the folder and
+        # the generation to run with cProfile (saved as "neuro-{name}-genXXX.prof")
+        self.metrics_callbacks: typing.List[typing.Callable[[GenerationMetrics], None]] = []
+        self.metrics_log = False
+        self.profile_generation = None
+
+        # Functions called with (evaluated, total) after every genome evaluation
+        self.progress_callbacks: typing.List[typing.Callable[[int, int], None]] = []
+        self._interrupt = threading.Event()
+
         # Settings used for the generation of new genomes
         self.genome_class = genome_class
         self.genome_setup_args = genome_setup_args
@@ -43,7 +98,25 @@ class NeuroEvolution(NeuralManager):
 
         super().__init__(name, folder)
 
+        # Metrics of the current or last generation
+        self.metrics = GenerationMetrics(self.generation)
+
+        # Evaluator used instead of evaluating genomes one by one in this process
+        # (see use_process_pool)
+        self.evaluator = None
+
+        # Background writer used by save_to_file (see enable_async_checkpoints)
+        self.checkpointer = None
+
+        # Cache used to skip the evaluation of known networks (see enable_fitness_cache)
+        self.fitness_cache = None
+
         self.genomes: typing.List[Genome] = []
+        # Genomes kept unmutated from the previous generation
+        self._elites: typing.List[Genome] = []
+        # Genomes available for reuse (see reuse_genomes) and the options they were set up with
+        self._genome_pool: typing.List[Genome] = []
+        self._genome_pool_options = None
         self.__is_setup_done = False
 
     def _get_repopulate_rest(self) -> int:
@@ -54,18 +127,22 @@ class NeuroEvolution(NeuralManager):
             raise AssertionError("Population size is too small!")
         return rest
 
+    def _convert_network(self, network: NeuralNetwork) -> NeuralNetwork:
+        "Convert a network to the selected parameter type (if necessary)"
+
+        dtype = np.dtype(self.dtype or "float64")
+        if network.dtype != dtype:
+            return network.astype(dtype)
+        return network
+
     def _new_genome(self, network: NeuralNetwork) -> Genome:
         "Create a new genome based on the stored options"
 
+        network = self._convert_network(network)
         genome = self.genome_class(network)
         genome.setup(*self.genome_setup_args, **self.genome_setup_kwargs)
         return genome
 
-    def _create_random_genomes(self, amount) -> typing.List[Genome]:
-        "Create random genomes with new networks via the _get_default_network() method"
-
-        return [self._new_genome(self._get_default_network()) for _ in range(amount)]
-
     def setup_from_scratch(self) -> None:
         "SETUP: Create a completely new population"
 
@@ -85,8 +162,20 @@ class NeuroEvolution(NeuralManager):
 
         data = self._load_data_from_file(filename)
 
-        for networkdict in data["networks"]:
-            network = NeuralNetwork.from_dict(networkdict)
+        if "params" in data:
+            # Binary format: the networks are views into the (memory-mapped) parameter block
+            masks = data.get("masks", [None] * len(data["actfunc_index"]))
+            networks = [
+                NeuralNetwork.from_params(data["sizes"], params, data["actfuncs"][actfuncindex], mask)
+                for params, actfuncindex, mask in zip(data["params"], data["actfunc_index"], masks)
+            ]
+        else:
+            networks = [NeuralNetwork.from_dict(networkdict) for networkdict in data["networks"]]
+
+        # Keep the type of the saved population unless another one has been selected
+        if self.dtype is None and networks:
+            self.dtype = networks[0].dtype.name
+        for network in networks:
             self.genomes.append(self._new_genome(network))
 
         # If population size was made bigger, add random genomes to fill up the gap
@@ -105,74 +194,498 @@ class NeuroEvolution(NeuralManager):
             self.setup_from_scratch()
 
     def save_to_file(self, filename:str=None) -> None:
-        "Save all networks to a file (used to resume learning later)"
+        """
+        Save all networks to a file (used to resume learning later)
+
+        If asynchronous checkpoints are enabled, only a snapshot is taken
+        here and the file is written on a background thread.
+        """
+
+        with self.metrics.phase("checkpoint"):
+            job = self._get_save_job(filename)
+
+            if self.checkpointer is not None:
+                self.checkpointer.submit(job)
+            else:
+                job()
+
+    def _get_save_job(self, filename: str = None) -> typing.Callable[[], None]:
+        "Take a snapshot of all networks and return a function which saves it to a file"
+
+        binary = self.save_format == "binary"
+        filename = filename or self._get_filename(binary=binary)
+
+        networks = [genome.network for genome in self.genomes]
+        sizes = [network.sizes.copy() for network in networks]
+        params = [network.get_params() for network in networks]
+        actfuncs = [deepcopy(network.actfuncs) for network in networks]
+        # Masks are never changed in place
+        masks = [network.mask for network in networks]
+        highscore = float(self.genomes[0].score)
+        generation = self.generation
+
+        if binary:
+            if any(size != sizes[0] for size in sizes):
+                raise ValueError("The binary format requires all networks to have the same sizes!")
+
+            # Activation functions are usually the same for all networks, so only unique ones are stored
+            actfunctable, actfuncindex = [], []
+            for networkactfuncs in actfuncs:
+                if networkactfuncs not in actfunctable:
+                    actfunctable.append(networkactfuncs)
+                actfuncindex.append(actfunctable.index(networkactfuncs))
+
+            data = {
+                "highscore": highscore,
+                "generation": generation,
+                "sizes": sizes[0],
+                "actfuncs": actfunctable,
+                "actfunc_index": actfuncindex,
+            }
+            if any(mask is not None for mask in masks):
+                data["masks"] = [None if mask is None else pack_mask(mask) for mask in masks]
+            return lambda: self._save_binary_state_to_file(data, np.stack(params), filename)
+
+        def job():
+            data = {
+                "highscore": highscore,
+                "generation": generation,
+                "networks": [
+                    NeuralNetwork.from_params(*network).to_dict()
+                    for network in zip(sizes, params, actfuncs, masks)
+                ],
+            }
+            self._save_state_to_file(data, filename)
+        return job
+
+    def enable_async_checkpoints(self, keep_last: int = None, max_pending: int = 1) -> None:
+        """
+        Write checkpoints (save_to_file) on a background thread
+
+        Keeps the saves of the ``keep_last`` latest generations (default: all).
+        """
+
+        self.disable_async_checkpoints()
+        self.checkpointer = CheckpointWriter(self, keep_last, max_pending)
+
+    def disable_async_checkpoints(self) -> None:
+        "Write all pending checkpoints and save synchronously again"
+
+        if self.checkpointer is not None:
+            self.checkpointer.close()
+            self.checkpointer = None
+
+    def flush_checkpoints(self) -> None:
+        "Wait until all pending checkpoints are written"
+
+        if self.checkpointer is not None:
+            self.checkpointer.flush()
+
+    def export_network_to_file(self, filename: str = None, binary: bool = False, prune_threshold: float = 0.0) -> None:
+        """
+        Export the best network to a file (used to evaluate the network later)
+
+        Binary exports can be memory-mapped by NeuroLoader. If
+        ``prune_threshold`` is greater than 0, weights with a magnitude of at
+        most this are pruned in the exported copy (see NeuralNetwork.prune).
+        """
+
+        network = self.genomes[0].network
+        if prune_threshold > 0:
+            network = network.clone()
+            network.prune(threshold=prune_threshold)
+        return self._export_network_to_file(network, filename, binary)
+
+    def use_process_pool(self, workers: int = None, chunksize: int = 1) -> None:
+        """
+        Evaluate genomes in a pool of ``workers`` processes (default: one per CPU)
+
+        The genomes are rebuilt in the workers from their network parameters
+        and the genome setup arguments, so the genome class has to be
+        importable and the setup arguments picklable. The workers always
+        call run_evaluation: genomes with LOCKSTEP = True (only evaluated
+        together in this process) must implement it as well.
+        """
+
+        self._check_remote_evaluation()
+        self.close_evaluator()
+        self.evaluator = ProcessPoolEvaluator(workers, chunksize)
+
+    def use_shared_memory(self, workers: int = None, chunksize: int = 1) -> None:
+        """
+        Evaluate genomes in a pool of ``workers`` processes which read the
+        network parameters from shared memory (default: one per CPU)
+
+        New genomes are written directly to the shared memory, so only their
+        position is sent to the workers instead of all parameters. The same
+        requirements as for use_process_pool apply; additionally all
+        networks must have the same sizes.
+        """
+
+        self._check_remote_evaluation()
+        self.close_evaluator()
+        self.evaluator = SharedMemoryEvaluator(workers, chunksize)
+
+    def use_distributed(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT, prefetch: int = 2,
+                        timeout: float = 10.0, token: str = None) -> None:
+        """
+        Evaluate genomes on workers connected over TCP (see DistributedEvaluator)
 
-        data = {
-            "highscore": self.genomes[0].score,
-            "generation": self.generation,
-            "networks": list(map(lambda g: g.network.to_dict(), self.genomes)),
-        }
-        self._save_state_to_file(data, filename)
+        Listens on ``host``/``port`` (use "0.0.0.0" to accept workers from
+        other machines). Workers are started with ``python -m neural_network
+        worker HOST:PORT`` and need to be able to import the genome class.
+        As with use_process_pool, the genomes must implement run_evaluation.
+        """
+
+        self._check_remote_evaluation()
+        self.close_evaluator()
+        self.evaluator = DistributedEvaluator(host, port, prefetch, timeout, token=token)
+
+    def _check_remote_evaluation(self) -> None:
+        "Make sure the genomes can be evaluated by the workers of an evaluator"
+
+        if self.genome_class.run_evaluation is Genome.run_evaluation:
+            raise ValueError(f"{self.genome_class.__name__} doesn't implement run_evaluation, which workers use "
+                             "(LOCKSTEP genomes are only evaluated together in this process)!")
+
+    def close_evaluator(self) -> None:
+        "Shut down the evaluator (if any) and evaluate genomes in this process again"
+
+        if self.evaluator is not None:
+            self.evaluator.close()
+            self.evaluator = None
+
+    def request_interrupt(self) -> None:
+        """
+        Interrupt the running generation after the current genome evaluation
+
+        Can be called from any thread. run_generation then restores the
+        state from before the generation and raises GenerationInterrupted.
+        """
+
+        self._interrupt.set()
 
-    def export_network_to_file(self, filename: str = None) -> None:
-        "Export the best network to a file (used to evaluate the network later"
+    def _report_progress(self, evaluated: int, total: int) -> None:
+        "Called after every genome evaluation - calls the callbacks and checks for interruptions"
 
-        return self._export_network_to_file(self.genomes[0].network, filename)
+        for callback in self.progress_callbacks:
+            callback(evaluated, total)
+
+        if self._interrupt.is_set():
+            self._interrupt.clear()
+            raise GenerationInterrupted(f"Generation {self.generation} interrupted!")
 
     def run_generation(self) -> float:
-        "Run a generation - returns the highscore"
+        """
+        Run a generation - returns the highscore
+
+        If the generation doesn't finish (interrupted or any error), the
+        state of the last finished generation is restored before raising.
+        """
+
+        self._interrupt.clear()
+        previous = (self.generation, self.genomes, self.metrics)
+
+        try:
+            highscore = self._run_generation_profiled()
+        except GenerationInterrupted:
+            self.generation, self.genomes, self.metrics = previous
+            print(f"Generation {self.generation + 1} interrupted!")
+            raise
+        except BaseException:
+            # E.g. an error in a genome or a second Ctrl+C: never leave a half-evaluated population behind
+            self.generation, self.genomes, self.metrics = previous
+            raise
+
+        self._publish_metrics()
+        return highscore
+
+    def _run_generation_profiled(self) -> float:
+        "Run a generation, with cProfile if selected - returns the highscore"
+
+        if self.profile_generation is not None and self.profile_generation == self.generation + 1:
+            profiler = cProfile.Profile()
+            highscore = profiler.runcall(self._run_generation)
+            filename = f"neuro-{self.name}-gen{str(self.generation).zfill(3)}.prof"
+            profiler.dump_stats(self.folder+filename)
+            print(f"Profile saved to '{filename}'")
+            return highscore
+
+        return self._run_generation()
+
+    def _run_generation(self) -> float:
+        "Run a generation and measure its phases - returns the highscore"
+
+        start = time.perf_counter()
 
         self.generation += 1
+        self.metrics = GenerationMetrics(self.generation)
         learning_rate = self._get_learning_rate()
 
         print(f"Generation {self.generation} generating... (learning rate: {learning_rate})", end=" ")
 
         if self.generation > 0:
             # No need to generate genomes in generation 0!
-            self._generate_genomes(learning_rate)
+            with self.metrics.phase("generate"):
+                self._generate_genomes(learning_rate)
 
         print("Done! Running training...")
 
-        for genome in tqdm(self.genomes[:self.population_size], desc=f"Generation {self.generation}"):
-            genome.run_evaluation(self.generation)
+        with self.metrics.phase("evaluate"):
+            self._evaluate_genomes(self.genomes[:self.population_size])
 
-        self._sort_genomes()
+        with self.metrics.phase("sort"):
+            self._sort_genomes()
         highscore = self.genomes[0].score
 
+        if self.checkpoint_interval and self.generation % self.checkpoint_interval == 0:
+            self.save_to_file()
+
+        self.metrics.highscore = highscore
+        self.metrics.wall_time = time.perf_counter() - start
+
         print(f"Generation {self.generation} ended! Highscore: {highscore}")
         return highscore
 
+    def _publish_metrics(self) -> None:
+        "Pass the metrics of the last generation to the callbacks and the log file"
+
+        timed = [(rank, genome) for rank, genome in enumerate(self.genomes) if genome.evaluation_time is not None]
+        timed.sort(key=lambda item: item[1].evaluation_time, reverse=True)
+        self.metrics.slowest = [
+            {"rank": rank, "seconds": genome.evaluation_time, "score": genome.score}
+            for rank, genome in timed[:5]
+        ]
+
+        if self.metrics_log:
+            with open(self.folder+f"neuro-{self.name}-metrics.jsonl", "a", encoding="utf-8") as file:
+                file.write(json.dumps(self.metrics.to_dict(), default=float) + "\n")
+
+        for callback in self.metrics_callbacks:
+            callback(self.metrics)
+
+    def enable_fitness_cache(self, maxsize: int = 1000, stochastic: bool = False) -> None:
+        """
+        Skip the evaluation of networks which have been evaluated before
+
+        Only use this if the score of a network does not change between
+        evaluations. If it does, set ``stochastic`` to evaluate every network
+        anyway and use the mean of all its scores. See FitnessCache.
+        """
+
+        self.fitness_cache = FitnessCache(maxsize, stochastic)
+
+    def disable_fitness_cache(self) -> None:
+        "Evaluate every genome again"
+
+        self.fitness_cache = None
+
+    def _evaluate_genomes(self, genomes: typing.List[Genome]) -> None:
+        "Run the evaluation of the given genomes, skipping the ones with a cached score"
+
+        if self.fitness_cache is None:
+            self._run_evaluations(genomes)
+            self._store_scores(genomes)
+            return
+
+        keys = [self.fitness_cache.get_key(genome.network) for genome in genomes]
+        uncached = []
+        for genome, key in zip(genomes, keys):
+            score = self.fitness_cache.get(key)
+            if score is None:
+                uncached.append((genome, key))
+            else:
+                genome.score = score
+
+        if not uncached:
+            return
+        self._run_evaluations([genome for genome, _ in uncached])
+        self._store_scores([genome for genome, _ in uncached])
+
+        for genome, key in uncached:
+            # Partial scores (successive halving) aren't comparable to full ones
+            if genome.evaluation_budget is None:
+                genome.score = self.fitness_cache.put(key, genome.score)
+
+    @staticmethod
+    def _store_scores(genomes: typing.List[Genome]) -> None:
+        "Read the score of every genome once, so sorting and saving don't have to compute it again"
+
+        for genome in genomes:
+            genome.score = genome.score
+
+    def _run_evaluations(self, genomes: typing.List[Genome]) -> None:
+        "Run the evaluation of the given genomes"
+
+        if self.evaluator is not None:
+            self.evaluator.evaluate(self, genomes)
+            return
+
+        if self.genome_class.LOCKSTEP:
+            self._evaluate_genomes_lockstep(genomes)
+            return
+
+        if self.halving_rounds and self.genome_class.BUDGET:
+            self._evaluate_genomes_halving(genomes)
+            return
+
+        for index, genome in enumerate(tqdm(genomes, desc=f"Generation {self.generation}")):
+            forward_passes = genome.network.forward_passes
+            start = time.perf_counter()
+            genome.run_evaluation(self.generation)
+            genome.evaluation_time = time.perf_counter() - start
+            self.metrics.add_evaluation(genome.evaluation_time, genome.network.forward_passes - forward_passes)
+            self._report_progress(index + 1, len(genomes))
+
+    def _evaluate_genomes_halving(self, genomes: typing.List[Genome]) -> None:
+        """
+        Run the evaluation of the genomes in rounds of increasing budget, only
+        continuing the evaluation of the best ones (successive halving)
+
+        Genomes which don't reach the last round keep their partial score and
+        ``evaluation_budget``, which is used to rank them below all fully
+        evaluated genomes.
+        """
+
+        budgets = [self.halving_keep_fraction ** (self.halving_rounds - i) for i in range(self.halving_rounds + 1)]
+        minimum = max(self.repop_best_n, self.repop_amount_keep)
+        elites = set(map(id, self._elites))
+
+        times = {id(genome): 0.0 for genome in genomes}
+        forward_passes = {id(genome): genome.network.forward_passes for genome in genomes}
+
+        for genome in genomes:
+            genome.budget_start(self.generation)
+
+        active = list(genomes)
+        with tqdm(total=len(genomes), desc=f"Generation {self.generation}") as progress:
+            for roundindex, budget in enumerate(budgets):
+                for genome in active:
+                    start = time.perf_counter()
+                    genome.budget_continue(budget)
+                    times[id(genome)] += time.perf_counter() - start
+                    genome.evaluation_budget = budget
+
+                if roundindex < len(budgets) - 1:
+                    active.sort(key=lambda genome: genome.score, reverse=True)
+                    keep = max(math.ceil(len(active) * self.halving_keep_fraction), minimum)
+                    finished = [genome for genome in active[keep:] if id(genome) not in elites]
+                    active = active[:keep] + [genome for genome in active[keep:] if id(genome) in elites]
+                else:
+                    finished = active
+                    for genome in finished:
+                        genome.evaluation_budget = None
+
+                for genome in finished:
+                    genome.evaluation_time = times[id(genome)]
+                    self.metrics.add_evaluation(
+                        genome.evaluation_time, genome.network.forward_passes - forward_passes[id(genome)])
+                    progress.update(1)
+                    self._report_progress(progress.n, len(genomes))
+
+    def _evaluate_genomes_lockstep(self, genomes: typing.List[Genome]) -> None:
+        "Run the evaluation of all genomes together, with one batched forward pass per tick"
+
+        engine = PopulationEngine([genome.network for genome in genomes])
+
+        for genome in genomes:
+            genome.lockstep_start(self.generation)
+
+        active = list(range(len(genomes)))
+
+        with tqdm(total=len(genomes), desc=f"Generation {self.generation}") as progress:
+            while active:
+                indexes, observations = [], []
+                for index in active:
+                    observation = genomes[index].lockstep_observe()
+                    if observation is None:
+                        progress.update(1)
+                        self._report_progress(progress.n, len(genomes))
+                    else:
+                        indexes.append(index)
+                        observations.append(observation)
+
+                if indexes:
+                    # The engine only copies the parameters of the active networks when some are done
+                    outputs = engine.feed_forward(observations, indexes if len(indexes) < len(genomes) else None)
+                    for index, output in zip(indexes, outputs):
+                        genomes[index].lockstep_act(output)
+
+                active = indexes
+
+        # Evaluated together: no time per genome
+        self.metrics.evaluations += len(genomes)
+        self.metrics.forward_passes += engine.forward_passes
+
     def _generate_genomes(self, learning_rate) -> None:
         "Generate new genomes based on the success of the previous ones"
 
         oldgenomes = self.genomes
-        newgenomes = []
 
-        newgenomes += self._create_random_genomes(self.repop_amount_random_add)
+        randomnetworks = [self._get_default_network() for _ in range(self.repop_amount_random_add)]
 
         indexes_to_keep = range(self.repop_amount_keep)
-
-        for i in indexes_to_keep:
-            orig = oldgenomes[i]
-
-            network = orig.network.clone()
-            newgenomes.append(self._new_genome(network))
+        keptnetworks = [self._clone_network(oldgenomes[i].network) for i in indexes_to_keep]
 
         indexes_to_mutate = random.choices(range(self.population_size), k=self.repop_amount_random_mutate)
         indexes_to_mutate += random.choices(range(self.repop_best_n), k=self._get_repopulate_rest())
 
+        mutatednetworks = []
         for i in indexes_to_mutate:
             orig = oldgenomes[i]
 
-            network = orig.network.clone_and_mutate(learning_rate, self.mutation_chance)
-            newgenomes.append(self._new_genome(network))
+            network = self._clone_network(orig.network)
+            network.mutate(learning_rate, self.mutation_chance, prune_threshold=self.prune_threshold)
+            mutatednetworks.append(network)
 
+        newgenomes = self._create_genomes(randomnetworks + keptnetworks + mutatednetworks)
+        self._elites = newgenomes[len(randomnetworks):len(randomnetworks)+len(keptnetworks)]
         self.genomes = newgenomes
 
+    def _create_genomes(self, networks: typing.List[NeuralNetwork]) -> typing.List[Genome]:
+        """
+        Create the genomes for the networks of a new generation
+
+        If ``reuse_genomes`` is enabled, the genomes of the generation before
+        the current one are reset with the new networks instead (the current
+        ones are still needed if the new generation is interrupted).
+        """
+
+        if not self.reuse_genomes:
+            return [self._new_genome(network) for network in networks]
+
+        options = (self.genome_class, self.genome_setup_args, self.genome_setup_kwargs)
+        if self._genome_pool_options != options:
+            self._genome_pool = []
+            self._genome_pool_options = options
+
+        inuse = set(map(id, self.genomes))
+        spare = [genome for genome in self._genome_pool if id(genome) not in inuse]
+
+        genomes = []
+        for network in networks:
+            if spare:
+                genome = spare.pop()
+                genome.reset(self._convert_network(network))
+            else:
+                genome = self._new_genome(network)
+            genomes.append(genome)
+
+        self._genome_pool = self.genomes + genomes
+        return genomes
+
+    def _clone_network(self, network: NeuralNetwork) -> NeuralNetwork:
+        "Copy a network for the next generation (the evaluator may decide where it's stored)"
+
+        if self.evaluator is not None:
+            return self.evaluator.clone_network(self, network)
+        return network.clone()
+
     def _sort_genomes(self) -> None:
         "Sort the genomes by score"
 
-        self.genomes.sort(key=lambda genome: genome.score, reverse=True)
+        # Genomes whose evaluation was stopped early (successive halving) rank below the others
+        self.genomes.sort(key=lambda genome: (genome.evaluation_budget or 1, genome.score), reverse=True)
 
     def _get_learning_rate(self) -> float:
         "Calculate the learning rate for the current generation"
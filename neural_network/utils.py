@@ -1,5 +1,25 @@
 import random
 
+import numpy as np
+
+# Generator used for all vectorized random numbers - see seed()
+_rng = np.random.default_rng()
+
+def seed(value=None) -> None:
+    """Seed the random number generators (both ``random`` and the numpy generator)."""
+    global _rng
+    random.seed(value)
+    _rng = np.random.default_rng(value)
+
+def get_rng() -> np.random.Generator:
+    """Get the numpy random number generator used by default."""
+    return _rng
+
 def randplusminus(maximum=1):
     """Generates a random number between -maximum and maximum."""
     return maximum - (random.random() * 2 * maximum)
+
+def randplusminus_array(shape, maximum=1, rng: np.random.Generator = None) -> np.ndarray:
+    """Generates an array of random numbers between -maximum and maximum."""
+    rng = rng or _rng
+    return maximum - (rng.random(shape) * 2 * maximum)
@@ -7,5 +7,8 @@ setup(
     author='Rafael Urben',
     author_email='github@rafaelurben.ch',
     packages=['neural_network'],
-    install_requires=["tqdm>=4.62.3"],
+    install_requires=["tqdm>=4.62.3", "numpy>=1.20"],
+    entry_points={
+        "console_scripts": ["neural-network=neural_network.cli:main"],
+    },
 )
@@ -0,0 +1,134 @@
+"Compiled networks must give the same results as the reference implementation"
+
+import numpy as np
+import pytest
+
+from neural_network import NeuralNetwork, NeuroLoader
+from neural_network.supervised import SupervisedTrainer
+
+ACFUNCS = ["identity", "relu", "leaky_relu", "sigmoid", "binary_step"]
+
+
+def random_inputs(network: NeuralNetwork, count: int = 50) -> np.ndarray:
+    return np.random.default_rng(0).normal(size=(count, network.sizes[0]))
+
+
+def assert_equivalent(network: NeuralNetwork, compiled, inputs: np.ndarray, rtol: float) -> None:
+    expected = network.feed_forward_batch(inputs)
+    actual = compiled.feed_forward_batch(inputs)
+    assert actual.shape == expected.shape
+    np.testing.assert_allclose(actual, expected, rtol=rtol, atol=rtol * max(1.0, np.abs(expected).max()))
+
+
+@pytest.mark.parametrize("acfunc", ACFUNCS)
+def test_acfunc_float64(acfunc):
+    network = NeuralNetwork([6, 10, 8, 3], default_acfunc=acfunc)
+    assert_equivalent(network, network.compile(np.float64), random_inputs(network), 1e-12)
+
+
+@pytest.mark.parametrize("acfunc", [a for a in ACFUNCS if a != "binary_step"])
+def test_acfunc_float32(acfunc):
+    # binary_step isn't compared in float32: rounding can flip values close to 0
+    network = NeuralNetwork([6, 10, 8, 3], default_acfunc=acfunc)
+    assert_equivalent(network, network.compile(), random_inputs(network), 1e-4)
+
+
+@pytest.mark.parametrize("fuse", [True, False])
+def test_identity_fusion(fuse):
+    network = NeuralNetwork([5, 7, 9, 4, 2])
+    network.actfuncs = ["identity", "identity", "relu", "sigmoid"]
+    compiled = network.compile(np.float64, fuse=fuse)
+
+    # Both identity layers are merged into the relu layer
+    assert compiled.sizes == ([5, 4, 2] if fuse else network.sizes)
+    assert_equivalent(network, compiled, random_inputs(network), 1e-10)
+
+
+def test_identity_output_layer():
+    network = NeuralNetwork([4, 6, 3])
+    network.actfuncs = ["sigmoid", "identity"]
+    assert_equivalent(network, network.compile(np.float64), random_inputs(network), 1e-12)
+
+
+def test_mixed_layer():
+    network = NeuralNetwork([4, 5, 3])
+    network.actfuncs = [["relu", "sigmoid", "identity", "leaky_relu", "binary_step"], "sigmoid"]
+    assert_equivalent(network, network.compile(np.float64), random_inputs(network), 1e-12)
+
+
+def test_actfuncs_changed_in_place():
+    network = NeuralNetwork([4, 5, 3])
+    inputs = random_inputs(network)
+    before = network.feed_forward_batch(inputs)
+
+    network.actfuncs[0] = "sigmoid"
+    assert not np.allclose(network.feed_forward_batch(inputs), before)
+    assert_equivalent(network, network.compile(np.float64), inputs, 1e-12)
+
+    network.actfuncs[1] = ["relu"] * 3
+    network.actfuncs[1][1] = "identity"
+    assert_equivalent(network, network.compile(np.float64), inputs, 1e-12)
+    expected = NeuralNetwork.from_params(network.sizes, network.params, ["sigmoid", ["relu", "identity", "relu"]])
+    np.testing.assert_array_equal(network.feed_forward_batch(inputs), expected.feed_forward_batch(inputs))
+
+
+def test_float16_network():
+    network = NeuralNetwork([6, 12, 3], default_acfunc="sigmoid", dtype="float16")
+    assert_equivalent(network, network.compile(), random_inputs(network), 1e-4)
+
+
+def test_float16_inputs():
+    network = NeuralNetwork([6, 12, 3], default_acfunc="leaky_relu")
+    inputs = random_inputs(network).astype(np.float16)
+    assert_equivalent(network, network.compile(np.float64), inputs, 1e-12)
+
+
+def test_feed_forward_single():
+    network = NeuralNetwork([3, 4, 2], default_acfunc="sigmoid")
+    compiled = network.compile(np.float64)
+    assert compiled.feed_forward([0.1, -0.5, 2.0]) == pytest.approx(network.feed_forward([0.1, -0.5, 2.0]))
+
+
+def test_batch_sizes_reuse_buffers():
+    network = NeuralNetwork([4, 8, 2])
+    compiled = network.compile(np.float64)
+    for count in [1, 7, 1, 30, 7]:
+        assert_equivalent(network, compiled, random_inputs(network, count), 1e-12)
+
+
+def test_result_not_overwritten():
+    network = NeuralNetwork([4, 8, 2])
+    compiled = network.compile()
+    inputs = random_inputs(network, 5)
+    first = compiled.feed_forward_batch(inputs)
+    copy = first.copy()
+    compiled.feed_forward_batch(inputs * 2)
+    np.testing.assert_array_equal(first, copy)
+
+
+def test_independent_of_later_changes():
+    network = NeuralNetwork([4, 8, 2])
+    compiled = network.compile(np.float64)
+    inputs = random_inputs(network)
+    expected = network.feed_forward_batch(inputs)
+
+    network.mutate(1.0, 1.0)
+    np.testing.assert_allclose(compiled.feed_forward_batch(inputs), expected, rtol=1e-12)
+
+
+def test_invalid_inputs():
+    compiled = NeuralNetwork([4, 8, 2]).compile()
+    with pytest.raises(ValueError):
+        compiled.feed_forward_batch(np.zeros((3, 5)))
+
+
+@pytest.mark.parametrize("binary", [False, True])
+def test_loader_compile(tmp_path, binary):
+    network = NeuralNetwork([5, 7, 9, 3])
+    network.actfuncs = ["identity", ["relu", "sigmoid"] * 4 + ["identity"], "sigmoid"]
+    folder = str(tmp_path) + "/"
+    SupervisedTrainer(network, name="test", folder=folder).export_network_to_file(binary=binary)
+
+    loader = NeuroLoader("test", folder, binary=binary)
+    assert_equivalent(network, loader.compile(np.float64), random_inputs(network), 1e-12)
+    assert_equivalent(network, loader.compile(), random_inputs(network), 1e-4)
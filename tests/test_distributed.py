@@ -0,0 +1,129 @@
+"The coordinator must evaluate all genomes on worker processes, also if workers die"
+
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from neural_network import NeuralNetwork, NeuroEvolution, Genome
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TESTS = os.path.dirname(os.path.abspath(__file__))
+
+
+def expected_score(network: NeuralNetwork) -> float:
+    inputs = np.linspace(-1.0, 1.0, network.sizes[0])
+    return float(network.feed_forward_batch(inputs[np.newaxis])[0].sum())
+
+
+class SlowGenome(Genome):
+    "Imported by the workers as test_distributed:SlowGenome"
+
+    def setup(self, delay: float):
+        self.delay = delay
+
+    def run_evaluation(self, generation: int = None):
+        time.sleep(self.delay)
+        self.score = expected_score(self.network)
+
+
+class SizesNeuroEvolution(NeuroEvolution):
+    sizes = [4, 6, 2]
+
+    def _get_default_network(self) -> NeuralNetwork:
+        return NeuralNetwork(list(self.sizes), default_acfunc="sigmoid")
+
+
+def start_worker(port: int) -> subprocess.Popen:
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])))
+    return subprocess.Popen(
+        [sys.executable, "-m", "neural_network", "worker", f"127.0.0.1:{port}", "--connect-timeout", "20"],
+        cwd=TESTS, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def create_trainer(tmp_path, delay: float, population_size: int, timeout: float) -> NeuroEvolution:
+    trainer = SizesNeuroEvolution(SlowGenome, delay, folder=f"{tmp_path}/")
+    trainer.population_size = population_size
+    trainer.repop_amount_keep = 1
+    trainer.repop_best_n = 2
+    trainer.use_distributed("127.0.0.1", 0, timeout=timeout)
+    trainer.setup_from_scratch()
+    return trainer
+
+
+def stop_workers(trainer: NeuroEvolution, workers: list) -> None:
+    trainer.close_evaluator()
+    for worker in workers:
+        try:
+            worker.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            worker.kill()
+
+
+@pytest.fixture
+def watchdog():
+    "Interrupt the generation instead of waiting forever if genomes get lost"
+
+    timers = []
+    def start(trainer: NeuroEvolution, seconds: float = 60.0) -> None:
+        timers.append(threading.Timer(seconds, trainer.request_interrupt))
+        timers[-1].start()
+    yield start
+    for timer in timers:
+        timer.cancel()
+
+
+def assert_evaluated(trainer: NeuroEvolution) -> None:
+    for genome in trainer.genomes:
+        assert genome.score == expected_score(genome.network)
+
+
+def test_workers_lost_during_and_between_generations(tmp_path, watchdog):
+    trainer = create_trainer(tmp_path, 0.02, population_size=12, timeout=5.0)
+    watchdog(trainer)
+    workers = [start_worker(trainer.evaluator.address[1]) for _ in range(3)]
+    try:
+        trainer.run_generation()
+        assert_evaluated(trainer)
+
+        # Kill a worker while it has tasks: they must be sent to the other workers
+        def kill_worker(evaluated, _):
+            if evaluated == 3 and workers[0].poll() is None:
+                workers[0].kill()
+                workers[0].wait()
+        trainer.progress_callbacks.append(kill_worker)
+        trainer.run_generation()
+        trainer.progress_callbacks.remove(kill_worker)
+        assert workers[0].poll() is not None
+        assert_evaluated(trainer)
+
+        # Kill a worker between two generations: sending to it fails
+        workers[1].kill()
+        workers[1].wait()
+        trainer.run_generation()
+        assert_evaluated(trainer)
+        assert len(trainer.evaluator.workers) == 1
+    finally:
+        stop_workers(trainer, workers)
+
+
+def test_large_tasks_to_busy_workers(tmp_path, watchdog, monkeypatch):
+    # About 13 MB per task, more than the socket buffers: the prefetched task
+    # can't be sent completely while the worker evaluates longer than the timeout
+    monkeypatch.setattr(SizesNeuroEvolution, "sizes", [512, 1024, 1024, 64])
+    trainer = create_trainer(tmp_path, 3.5, population_size=4, timeout=3.0)
+    trainer.evaluator.prefetch = 2
+    watchdog(trainer)
+    workers = [start_worker(trainer.evaluator.address[1]) for _ in range(2)]
+    try:
+        trainer.run_generation()
+        assert_evaluated(trainer)
+        assert len(trainer.evaluator.workers) == 2
+    finally:
+        stop_workers(trainer, workers)
+    # The stop message must also reach workers with a task still being received or evaluated
+    assert [worker.returncode for worker in workers] == [0, 0]
@@ -0,0 +1,121 @@
+"Pruned networks must keep their exact mask and give the same results as dense ones"
+
+import numpy as np
+import pytest
+
+from neural_network import NeuralNetwork, NeuroLoader, NeuroEvolution, Genome
+from neural_network import network as network_module
+from neural_network.supervised import SupervisedTrainer
+
+
+class ConstantGenome(Genome):
+    def setup(self):
+        pass
+
+    def run_evaluation(self, generation: int = None):
+        self.score = 0.0
+
+
+def pruned_network(sizes=(6, 10, 8, 3), fraction: float = 0.5) -> NeuralNetwork:
+    network = NeuralNetwork(list(sizes), default_acfunc="leaky_relu")
+    network.prune(fraction=fraction)
+    # A live weight which is exactly 0 must not be mistaken for a pruned one
+    live = np.flatnonzero(network.mask[network.get_layer_slices(network.sizes)[0][0]])
+    network.params[live[0]] = 0.0
+    return network
+
+
+def random_inputs(network: NeuralNetwork, count: int = 20) -> np.ndarray:
+    return np.random.default_rng(0).normal(size=(count, network.sizes[0]))
+
+
+def assert_same_network(actual: NeuralNetwork, expected: NeuralNetwork) -> None:
+    assert actual.sizes == expected.sizes
+    np.testing.assert_array_equal(actual.mask, expected.mask)
+    np.testing.assert_array_equal(actual.params, expected.params)
+    inputs = random_inputs(expected)
+    np.testing.assert_array_equal(actual.feed_forward_batch(inputs), expected.feed_forward_batch(inputs))
+
+
+def test_zero_weight_stays_live():
+    network = pruned_network()
+    before = np.count_nonzero(network.mask)
+    assert network.prune(threshold=0.0) == 1
+    assert np.count_nonzero(network.mask) == before - 1
+
+
+def test_prune_nothing_keeps_no_mask():
+    network = NeuralNetwork([4, 5, 2], default_weight=0.5)
+    assert network.prune(threshold=0.1) == 0
+    assert network.mask is None
+    network.mutate(0.01, 1.0, prune_threshold=0.1)
+    assert network.mask is None
+    assert "masks" not in network.to_dict()
+
+
+def test_dict_roundtrip():
+    network = pruned_network()
+    assert_same_network(NeuralNetwork.from_dict(network.to_dict()), network)
+    assert_same_network(NeuralNetwork.from_json(network.to_json()), network)
+
+
+def test_binary_export_roundtrip(tmp_path):
+    network = pruned_network()
+    folder = f"{tmp_path}/"
+    SupervisedTrainer(network, name="test", folder=folder).export_network_to_file(binary=True)
+    assert_same_network(NeuroLoader("test", folder, binary=True).network, network)
+
+
+def test_binary_checkpoint_roundtrip(tmp_path):
+    folder = f"{tmp_path}/"
+    trainer = NeuroEvolution(ConstantGenome, name="test", folder=folder)
+    trainer.population_size = 3
+    networks = [pruned_network(), NeuralNetwork([6, 10, 8, 3]), pruned_network(fraction=0.8)]
+    trainer.genomes = [trainer._new_genome(network) for network in networks] # pylint: disable=protected-access
+    for genome in trainer.genomes:
+        genome.score = 0.0
+    trainer.generation = 0
+    trainer.save_format = "binary"
+    trainer.save_to_file()
+
+    loaded = NeuroEvolution(ConstantGenome, name="test", folder=folder)
+    loaded.population_size = 3
+    loaded.setup_from_file()
+    assert loaded.genomes[1].network.mask is None
+    for genome, network in zip(loaded.genomes, networks):
+        assert_same_network(genome.network, network)
+
+
+def test_pruned_weights_stay_zero():
+    network = pruned_network()
+    pruned = ~network.mask
+
+    network.mutate(1.0, 1.0)
+    assert not np.any(network.params[pruned])
+    assert np.all(network.params[network.mask] != 0)
+
+    network.set_params(np.ones(network.params.shape))
+    assert not np.any(network.params[pruned])
+    assert np.all(network.params[network.mask] == 1)
+
+
+@pytest.mark.parametrize("count", [1, 2])
+def test_sparse_matches_dense(monkeypatch, count):
+    # Small layers are only processed as sparse matrices with a lower limit
+    monkeypatch.setattr(network_module, "SPARSE_MIN_WEIGHTS", 1)
+    network = pruned_network((40, 30, 20), fraction=0.98)
+    assert all(layer is not None for layer in network._sparse) # pylint: disable=protected-access
+
+    inputs = random_inputs(network, count)
+    for layerindex in range(1, len(network.sizes)):
+        sparse = network._sparse[layerindex-1] # pylint: disable=protected-access
+        actual = network._feed_forward_sparse(inputs, layerindex, sparse) # pylint: disable=protected-access
+        expected = inputs @ network.weights[layerindex-1].T + network.biases[layerindex-1]
+        np.testing.assert_allclose(actual, expected, rtol=1e-12, atol=1e-12)
+        inputs = np.random.default_rng(layerindex).normal(size=(count, network.sizes[layerindex]))
+
+    # Bigger batches use the dense product
+    inputs = random_inputs(network, count)
+    batch = np.concatenate([inputs, random_inputs(network, network_module.SPARSE_MAX_BATCH_SIZE + 1)])
+    np.testing.assert_allclose(network.feed_forward_batch(inputs), network.feed_forward_batch(batch)[:count],
+                               rtol=1e-12, atol=1e-12)
@@ -0,0 +1,86 @@
+"Backpropagation must match numeric gradients and the optimizer state must survive saving"
+
+import numpy as np
+import pytest
+
+from neural_network import NeuralNetwork
+from neural_network.supervised import SupervisedTrainer
+
+ACFUNCS = ["identity", "relu", "leaky_relu", "sigmoid"]
+
+
+def random_batch(network: NeuralNetwork, count: int = 8, seed: int = 0) -> tuple:
+    rng = np.random.default_rng(seed)
+    return rng.normal(size=(count, network.sizes[0])), rng.uniform(0.1, 0.9, size=(count, network.sizes[-1]))
+
+
+def numeric_gradient(trainer: SupervisedTrainer, inputs, targets, step: float = 1e-6) -> np.ndarray:
+    "Central differences of the loss for every parameter"
+
+    params = trainer.network.params
+    gradient = np.empty(params.shape)
+    for index in range(len(params)):
+        value = params[index]
+        params[index] = value + step
+        upper, _ = trainer.compute_gradient(inputs, targets)
+        params[index] = value - step
+        lower, _ = trainer.compute_gradient(inputs, targets)
+        params[index] = value
+        gradient[index] = (upper - lower) / (2 * step)
+    return gradient
+
+
+def assert_gradient(network: NeuralNetwork, loss: str, folder) -> None:
+    trainer = SupervisedTrainer(network, folder=f"{folder}/")
+    trainer.loss = loss
+    inputs, targets = random_batch(network)
+
+    _, gradient = trainer.compute_gradient(inputs, targets)
+    np.testing.assert_allclose(gradient, numeric_gradient(trainer, inputs, targets), rtol=1e-5, atol=1e-8)
+
+
+@pytest.mark.parametrize("acfunc", ACFUNCS)
+def test_gradient_mse(tmp_path, acfunc):
+    assert_gradient(NeuralNetwork([4, 6, 5, 3], default_acfunc=acfunc), "mse", tmp_path)
+
+
+def test_gradient_mixed_layer(tmp_path):
+    network = NeuralNetwork([4, 5, 3])
+    network.actfuncs = [["relu", "sigmoid", "identity", "leaky_relu", "sigmoid"], "identity"]
+    assert_gradient(network, "mse", tmp_path)
+
+
+def test_gradient_binary_cross_entropy(tmp_path):
+    network = NeuralNetwork([4, 6, 3])
+    network.actfuncs = [["sigmoid", "leaky_relu"] * 3, "sigmoid"]
+    assert_gradient(network, "binary_cross_entropy", tmp_path)
+
+
+@pytest.mark.parametrize("save_format", ["json", "binary"])
+@pytest.mark.parametrize("optimizer", ["adam", "sgd"])
+def test_optimizer_state_roundtrip(tmp_path, save_format, optimizer):
+    folder = f"{tmp_path}/"
+    network = NeuralNetwork([4, 6, 3], default_acfunc="sigmoid")
+    batches = [random_batch(network, seed=seed) for seed in range(3)]
+
+    trainer = SupervisedTrainer(network, name="test", folder=folder)
+    trainer.optimizer = optimizer
+    trainer.momentum = 0.9
+    trainer.save_format = save_format
+    trainer.train_epoch(batches)
+    trainer.save_to_file()
+
+    loaded = SupervisedTrainer(name="test", folder=folder)
+    loaded.momentum = 0.9
+    loaded.setup_from_file()
+    assert loaded.optimizer == optimizer
+    assert loaded.step == trainer.step
+    np.testing.assert_array_equal(loaded.network.params, trainer.network.params)
+    assert len(loaded.moments) == len(trainer.moments)
+    for actual, expected in zip(loaded.moments, trainer.moments):
+        np.testing.assert_array_equal(actual, expected)
+
+    # Training continues exactly as without saving
+    trainer.train_batch(*batches[0])
+    loaded.train_batch(*batches[0])
+    np.testing.assert_array_equal(loaded.network.params, trainer.network.params)